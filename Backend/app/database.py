@@ -16,4 +16,9 @@ posts_collection = db.posts
 likes_collection = db.likes
 comments_collection = db.comments
 saved_posts_collection = db.saved_posts
-friend_requests_collection = db.friends_requests
\ No newline at end of file
+friend_requests_collection = db.friends_requests
+timelines_collection = db.timelines
+ai_comments_collection = db.ai_comments
+follows_collection = db.follows
+blobs_collection = db.blobs
+gc_jobs_collection = db.gc_jobs
@@ -0,0 +1,186 @@
+"""
+Declarative MongoDB index registry.
+
+ensure_indexes() is called on application startup and is idempotent: indexes
+that already exist with the same definition are left alone. Indexes found in
+the database but not declared here are reported, never dropped.
+
+Unique indexes are required: routes such as the like/save toggles rely on
+them, so startup fails if one can't be built. When existing duplicates are
+what blocks a build, the migration listed in DEDUPE_MIGRATIONS runs first
+and the build is retried.
+
+Usage:
+    python -m app.indexes           # print the plan diff
+    python -m app.indexes --apply   # create missing indexes
+"""
+import asyncio
+import sys
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from .database import (
+    users_collection, posts_collection, likes_collection, comments_collection,
+    saved_posts_collection, messages_collection, friend_requests_collection, timelines_collection,
+    follows_collection, blobs_collection, gc_jobs_collection
+)
+
+INDEXES = {
+    users_collection: [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("username_lower", ASCENDING)], name="username_lower"),
+        IndexModel(
+            [("phone", ASCENDING)],
+            name="phone",
+            partialFilterExpression={"phone": {"$type": "string"}}
+        ),
+        IndexModel([("profile_image_blob", ASCENDING)], name="profile_image_blob", sparse=True),
+    ],
+    posts_collection: [
+        IndexModel([("timestamp", DESCENDING), ("_id", DESCENDING)], name="feed"),
+        IndexModel([("author_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="author_feed"),
+        IndexModel([("image_blob", ASCENDING)], name="image_blob", sparse=True),
+    ],
+    likes_collection: [
+        IndexModel([("user_id", ASCENDING), ("post_id", ASCENDING)], name="user_post_unique", unique=True),
+        IndexModel([("post_id", ASCENDING)], name="post_id"),
+    ],
+    saved_posts_collection: [
+        IndexModel([("user_id", ASCENDING), ("post_id", ASCENDING)], name="user_post_unique", unique=True),
+        IndexModel([("post_id", ASCENDING)], name="post_id"),
+    ],
+    comments_collection: [
+        IndexModel([("post_id", ASCENDING), ("timestamp", ASCENDING)], name="post_timestamp"),
+    ],
+    messages_collection: [
+        IndexModel([("chat_id", ASCENDING), ("timestamp", ASCENDING)], name="chat_timestamp"),
+    ],
+    friend_requests_collection: [
+        IndexModel([("receiver_id", ASCENDING), ("status", ASCENDING)], name="receiver_status"),
+        IndexModel(
+            [("sender_id", ASCENDING), ("receiver_id", ASCENDING), ("status", ASCENDING)],
+            name="sender_receiver_status"
+        ),
+    ],
+    timelines_collection: [
+        IndexModel(
+            [("owner_id", ASCENDING), ("timestamp", DESCENDING), ("post_id", DESCENDING)],
+            name="owner_timeline"
+        ),
+        IndexModel([("owner_id", ASCENDING), ("post_id", ASCENDING)], name="owner_post_unique", unique=True),
+        IndexModel([("owner_id", ASCENDING), ("author_id", ASCENDING)], name="owner_author"),
+        IndexModel([("post_id", ASCENDING)], name="post_id"),
+    ],
+    follows_collection: [
+        IndexModel(
+            [("follower_id", ASCENDING), ("followee_id", ASCENDING)],
+            name="follower_followee_unique",
+            unique=True
+        ),
+        IndexModel([("follower_id", ASCENDING), ("_id", DESCENDING)], name="following_page"),
+        IndexModel([("followee_id", ASCENDING), ("_id", DESCENDING)], name="followers_page"),
+    ],
+    blobs_collection: [
+        IndexModel([("refs", ASCENDING), ("created_at", ASCENDING)], name="refs_created"),
+    ],
+    gc_jobs_collection: [
+        IndexModel([("next_attempt_at", ASCENDING)], name="next_attempt_at"),
+    ],
+}
+
+# Migración (app.utils.migrations) que elimina los duplicados que impiden crear un índice único
+DEDUPE_MIGRATIONS = {
+    (likes_collection.name, "user_post_unique"): "dedupe_toggles",
+    (saved_posts_collection.name, "user_post_unique"): "dedupe_toggles",
+}
+
+
+class MissingIndexError(RuntimeError):
+    """A unique index the application depends on could not be built."""
+
+
+# Options that change an index's behaviour and must match for it to count as present
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _definition(spec: dict) -> tuple:
+    return (
+        tuple((field, int(direction)) for field, direction in dict(spec["key"]).items()),
+        tuple((option, spec.get(option)) for option in _COMPARED_OPTIONS)
+    )
+
+
+async def plan() -> list:
+    """
+    Compare the registry with the live database.
+    Returns (collection, index name, action) tuples where action is one of
+    "create", "conflict" (same name, different definition) or "undeclared".
+    """
+    changes = []
+    for collection, models in INDEXES.items():
+        existing = await collection.index_information()
+        declared = {model.document["name"]: model.document for model in models}
+        for name, spec in declared.items():
+            if name not in existing:
+                changes.append((collection.name, name, "create"))
+            elif _definition(existing[name]) != _definition(spec):
+                changes.append((collection.name, name, "conflict"))
+        for name in existing:
+            if name != "_id_" and name not in declared:
+                changes.append((collection.name, name, "undeclared"))
+    return changes
+
+
+async def _create_index(collection, model: IndexModel):
+    try:
+        await collection.create_indexes([model])
+    except OperationFailure as e:
+        migration = DEDUPE_MIGRATIONS.get((collection.name, model.document["name"]))
+        if e.code != 11000 or migration is None:
+            raise
+        # migrations importa este módulo, de ahí la importación diferida
+        from .utils.migrations import MIGRATIONS
+        print(f"Duplicates block index {collection.name}.{model.document['name']}, running migration {migration}")
+        await MIGRATIONS[migration]()
+        await collection.create_indexes([model])
+
+
+async def ensure_indexes():
+    """
+    Create every declared index. Unique indexes that can't be built raise
+    MissingIndexError once all the others have been tried; any other failure
+    is only logged so a bad index never blocks startup.
+    """
+    missing = []
+    for collection, models in INDEXES.items():
+        for model in models:
+            try:
+                await _create_index(collection, model)
+            except OperationFailure as e:
+                print(f"Error creating index {collection.name}.{model.document['name']}: {e}")
+                if model.document.get("unique"):
+                    missing.append(f"{collection.name}.{model.document['name']}")
+    if missing:
+        raise MissingIndexError(f"Required unique indexes could not be built: {', '.join(missing)}")
+
+
+def main(argv):
+    async def run():
+        changes = await plan()
+        if not changes:
+            print("Indexes are up to date")
+        for collection_name, index_name, action in changes:
+            print(f"{action:>10}  {collection_name}.{index_name}")
+        if "--apply" in argv:
+            await ensure_indexes()
+
+    try:
+        asyncio.run(run())
+    except MissingIndexError as e:
+        print(e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict
 from datetime import datetime
 
 class PostCreate(BaseModel):
@@ -9,7 +9,10 @@ class PostResponse(BaseModel):
     id: str
     author_id: str
     author_username: str
+    author_profile_image_url: Optional[str] = None
     image_url: str
+    # URLs por tamaño: thumb, feed y full (image_url apunta a full)
+    image_variants: Optional[Dict[str, str]] = None
     caption: str
     timestamp: str
     likes_count: int
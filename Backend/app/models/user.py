@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import List, Optional, Dict
 from enum import Enum
 
 class RequestStatus(str, Enum):
@@ -32,11 +32,24 @@ class UserResponse(BaseModel):
     username: str
     email: str
     profile_image_url: Optional[str] = None
+    profile_image_variants: Optional[Dict[str, str]] = None
     phone: Optional[str] = None
     birth_date: Optional[str] = None
-    followers: List[str] = []
-    following: List[str] = []
+    followers_count: int = 0
+    following_count: int = 0
     private_account: bool = False
+    # Solo se rellena cuando la petición indica quién mira el perfil
+    is_following: Optional[bool] = None
+
+class UserSummary(BaseModel):
+    """Entry of GET /users. Public: no email, phone or birth date (those are only in the admin export)."""
+    id: str
+    username: str
+    profile_image_url: Optional[str] = None
+    profile_image_variants: Optional[Dict[str, str]] = None
+    private_account: bool = False
+    followers_count: int = 0
+    following_count: int = 0
 
 class UserLogin(BaseModel):
     username: str
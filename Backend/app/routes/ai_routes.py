@@ -1,77 +1,146 @@
-from fastapi import APIRouter, HTTPException, Header, Depends
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from typing import Dict
+import json
 import os
 from dotenv import load_dotenv
-import requests
-from ..utils.auth import decode_token
+from ..utils.auth import get_current_user, get_admin_user
+from ..utils.ollama import ollama_client, OllamaError, OllamaBusyError, OLLAMA_MODEL, COMMENT_PROMPT
+from ..utils.ai_cache import comment_cache, image_digest, cache_key
+from ..utils.ai_jobs import ai_jobs, post_cache_key
 
 load_dotenv()
 
 router = APIRouter()
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+
+async def generate_comment_variant(key: str, image: str):
+    """Generate one more cached variant for an image that is already cached."""
+    try:
+        # Las variantes extra nunca compiten con peticiones en curso
+        if ollama_client.is_busy():
+            return
+        response = await ollama_client.generate(COMMENT_PROMPT, [image])
+        await comment_cache.add(key, response.strip('"'))
+    except OllamaError as e:
+        print(f"No se pudo generar una variante adicional: {str(e)}")
+    finally:
+        comment_cache.stop_filling(key)
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.get("/generate-comment/stats")
+async def get_ai_cache_stats(admin: dict = Depends(get_admin_user)):
+    return {**comment_cache.get_stats(), "jobs": ai_jobs.get_stats()}
 
 @router.post("/generate-comment")
 async def generate_ai_comment(
     image_url: Dict[str, str],
-    authorization: str | None = Header(default=None, alias="Authorization")
+    background_tasks: BackgroundTasks,
+    user_data: dict = Depends(get_current_user)
 ):
     try:
-        if not authorization:
+        image = image_url["url"]
+        key = cache_key(image_digest(image), COMMENT_PROMPT, OLLAMA_MODEL)
+
+        # Sugerencia precalculada al crear el post, si el cliente indica el post
+        cached_comment = None
+        if image_url.get("post_id"):
+            cached_comment = await comment_cache.pick(post_cache_key(image_url["post_id"]))
+
+        # Misma imagen, mismo prompt y modelo: responder desde la caché
+        if cached_comment is None:
+            cached_comment = await comment_cache.pick(key)
+        if cached_comment is not None:
+            if comment_cache.wants_variant(key):
+                comment_cache.start_filling(key)
+                background_tasks.add_task(generate_comment_variant, key, image)
+            return {"comment": cached_comment}
+
+        # La inferencia se hace con el cliente asíncrono compartido, sin bloquear el event loop
+        try:
+            response = await ollama_client.generate(COMMENT_PROMPT, [image])
+            comment = response.strip('"')
+            await comment_cache.add(key, comment)
+            return {"comment": comment}
+        except OllamaBusyError as e:
             raise HTTPException(
-                status_code=401, 
-                detail="Se requiere el encabezado de autorización"
+                status_code=429,
+                detail=str(e),
+                headers={"Retry-After": "5"}
             )
-        
-        try:
-            if authorization.startswith("Bearer "):
-                token = authorization.split(" ")[1]
-            else:
-                token = authorization
-                
-            user_data = decode_token(token)
-            
-            # Configuración de la solicitud a Ollama
-            ollama_request = {
-                "model": "minicpm-v",
-                "prompt": "Imagina que estas en una red social, genera un comentario para un post de otra persona, positivo y natural en español para esta imagen. Responde el comentario solamente sin ninguna introduccion como aqui tienes un posible comentario",
-                "images": [image_url["url"]],
-                "stream": False
-            }
-            
-            # Agregar mejor manejo de errores y logging
-            try:
-                response = requests.post(
-                    OLLAMA_API_URL,
-                    json=ollama_request,
-                    stream=False
-                )
-                
-                if response.status_code == 200:
-                    response_json = response.json()
-                    comment = response_json.get("response", "").strip('"')
-                    return {"comment": comment}
-                else:
-                    print(f"Error de Ollama - Status Code: {response.status_code}")
-                    print(f"Error de Ollama - Response: {response.text}")
-                    raise HTTPException(
-                        status_code=500, 
-                        detail=f"Error al generar el comentario: {response.text}"
-                    )
-            except requests.exceptions.RequestException as e:
-                print(f"Error de conexión con Ollama: {str(e)}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="Error de conexión con el servicio de IA"
-                )
-                
-        except HTTPException as he:
-            raise he
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Token de autenticación inválido")
-            
+        except OllamaError as e:
+            print(f"Error de conexión con Ollama: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error al generar el comentario: {str(e)}"
+            )
+
+    except HTTPException as he:
+        raise he
     except Exception as e:
         print(f"Error en generate_ai_comment: {str(e)}")
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail=f"Error en el servicio de IA: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/generate-comment/stream")
+async def stream_ai_comment(
+    request: Request,
+    image_url: Dict[str, str],
+    user_data: dict = Depends(get_current_user)
+):
+    """
+    Server-Sent Events version of /generate-comment: one `data: {"token": ...}`
+    event per token, then `event: done` with the full comment, or `event: error`.
+    """
+    image = image_url.get("url")
+    if not image:
+        raise HTTPException(status_code=400, detail="Falta la imagen")
+    key = cache_key(image_digest(image), COMMENT_PROMPT, OLLAMA_MODEL)
+
+    cached_comment = None
+    if image_url.get("post_id"):
+        cached_comment = await comment_cache.pick(post_cache_key(image_url["post_id"]))
+    if cached_comment is None:
+        cached_comment = await comment_cache.pick(key)
+    if cached_comment is None and ollama_client.is_saturated():
+        raise HTTPException(
+            status_code=429,
+            detail="El servicio de IA está saturado",
+            headers={"Retry-After": "5"}
+        )
+
+    async def events():
+        if cached_comment is not None:
+            yield sse_event({"token": cached_comment})
+            yield sse_event({"comment": cached_comment}, event="done")
+            return
+
+        tokens = []
+        generator = ollama_client.stream(COMMENT_PROMPT, [image])
+        try:
+            async for model_token in generator:
+                if await request.is_disconnected():
+                    print("Cliente desconectado, cancelando la generación")
+                    break
+                tokens.append(model_token)
+                yield sse_event({"token": model_token})
+            else:
+                comment = "".join(tokens).strip().strip('"')
+                await comment_cache.add(key, comment)
+                yield sse_event({"comment": comment}, event="done")
+        except OllamaError as e:
+            print(f"Error en stream_ai_comment: {str(e)}")
+            yield sse_event({"detail": str(e)}, event="error")
+        finally:
+            # Cierra la conexión con Ollama, que aborta la inferencia en curso
+            await generator.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
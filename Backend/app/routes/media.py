@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from ..utils.media import media_cache, resolve, stat_media, matches_etag, parse_range, iter_file_range
+from ..utils.blobs import blob_store
+from ..utils.images import image_processor
+from ..utils.auth import get_admin_user
+from ..utils.cleanup import garbage_collector
+import asyncio
+
+router = APIRouter()
+
+@router.get("/media/stats")
+async def get_media_stats(admin: dict = Depends(get_admin_user)):
+    return {
+        "cache": media_cache.get_stats(),
+        "blobs": blob_store.get_stats(),
+        "images": image_processor.get_stats(),
+        "gc": garbage_collector.get_stats()
+    }
+
+@router.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_upload(file_path: str, request: Request):
+    path = resolve(file_path)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    # Los blobs no cambian nunca: si están en memoria ni siquiera se hace stat
+    cached = media_cache.get(path)
+    if cached is not None and cached[0].immutable:
+        media, content = cached
+    else:
+        media = await asyncio.to_thread(stat_media, path)
+        content = cached[1] if cached is not None and media is not None and media.etag == cached[0].etag else None
+        if cached is not None and content is None:
+            media_cache.evict(path)
+    if media is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    headers = media.headers()
+    if matches_etag(request.headers.get("if-none-match"), media.etag):
+        return Response(status_code=304, headers=headers)
+
+    # If-Range: el rango solo vale si el cliente tiene esta misma versión
+    if_range = request.headers.get("if-range")
+    try:
+        byte_range = parse_range(request.headers.get("range"), media.size) if not if_range or if_range == media.etag else None
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{media.size}"})
+
+    if content is None and request.method == "GET":
+        content = await media_cache.fetch(media)
+
+    if byte_range is not None:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{media.size}"
+        if content is not None:
+            return Response(content=content[start:end + 1], status_code=206, headers=headers, media_type=media.content_type)
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            iter_file_range(path, start, end - start + 1),
+            status_code=206,
+            headers=headers,
+            media_type=media.content_type
+        )
+
+    if content is not None:
+        return Response(content=content, headers=headers, media_type=media.content_type)
+    # FileResponse usa envío sin copia (pathsend) cuando el servidor lo soporta
+    return FileResponse(path, headers=headers, media_type=media.content_type, stat_result=media.stat)
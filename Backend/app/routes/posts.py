@@ -1,98 +1,74 @@
-from fastapi import APIRouter, Header, HTTPException, UploadFile, File, Form, Request
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, Response, Query, BackgroundTasks
 from typing import List
 from ..models.post import PostCreate, PostResponse, CommentCreate, CommentResponse
 from ..database import users_collection, posts_collection, comments_collection, likes_collection, saved_posts_collection
-from ..utils.auth import decode_token 
+from ..utils.auth import get_current_user
+from ..utils.feed import (
+    assemble_feed, fetch_viewer_flags, visibility_filter, before_cursor_filter, encode_cursor, author_image_url, FEED_SORT
+)
+from ..utils.counters import post_counters
+from ..utils.loaders import UserLoader, get_user_loader
+from ..utils.uploads import save_upload, temp_upload_path, upload_path
+from ..utils.images import InvalidImageError
+from ..utils.blobs import blob_store
+from ..utils.profile_cache import profile_cache
+from ..utils.ai_jobs import ai_jobs, AI_PRECOMPUTE
+from ..utils.timeline import TIMELINE_MODE, fan_out_post, read_timeline, trim_timeline
+from ..utils.cleanup import garbage_collector
 from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+import asyncio
 import os
-import shutil
 
 router = APIRouter()
 
-# Create uploads directory if it doesn't exist
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "uploads")
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
-
 @router.post("/posts", response_model=PostResponse)
 async def create_post(
     request: Request,  # Add request parameter
+    background_tasks: BackgroundTasks,
     caption: str = Form(...),
-    image: UploadFile = File(..., description="Image file (max 16MB)"),
-    authorization: str | None = Header(default=None, alias="Authorization")
+    image: UploadFile = File(..., description="Image file (max UPLOAD_MAX_BYTES, 16MB by default)"),
+    user_data: dict = Depends(get_current_user)
 ):
+    image_blob = None
     try:
-        # Verificar tamaño del archivo
-        contents = await image.read()
-        if len(contents) > 16 * 1024 * 1024:  # 10MB limit
-            raise HTTPException(
-                status_code=413,
-                detail="El archivo es demasiado grande. El tamaño máximo permitido es 10MB"
-            )
-        
-        # Restablecer el puntero del archivo para su posterior uso
-        await image.seek(0)
-        
         print("Received request with:")
         print(f"Caption: {caption}")
         print(f"Image filename: {image.filename}")
-        print(f"Authorization header: {authorization}")
         print(f"Request headers: {dict(request.headers)}")
         
-        if not authorization:
-            raise HTTPException(
-                status_code=401, 
-                detail={
-                    "message": "Authorization header is required",
-                    "expected_format": "Bearer your_token_here"
-                }
-            )
-        
-        try:
-            if authorization.startswith("Bearer "):
-                token = authorization.split(" ")[1]
-            else:
-                token = authorization
-            
-            user_data = decode_token(token)
-        except HTTPException as he:
-            raise he  # Propagate 401 from decode_token
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid authentication token")
-            print(f"Successfully decoded token for user: {user_data['username']}")
-        except Exception as e:
-            print(f"Token validation error: {str(e)}")
-            raise HTTPException(
-                status_code=401,
-                detail={
-                    "message": "Invalid authentication token",
-                    "error": str(e)
-                }
-            )
-        print(f"Decoded user data: {user_data}")
-        
         user_id = user_data["user_id"]
-        username = user_data["username"]
-        
-        # Generar nombre único para la imagen
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        file_extension = os.path.splitext(image.filename)[1]
-        unique_filename = f"post_{user_id}_{timestamp}{file_extension}"
+        profile = await profile_cache.get(user_id)
+        if not profile:
+            raise HTTPException(status_code=401, detail="User not found")
+        username = profile["username"]
         
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-        # Save the file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        print(f"File saved at: {file_path}")
+        # Guardar el original por trozos; si supera el límite se corta con 413 sin dejar nada en disco
+        original_path = temp_upload_path(image.filename)
+        _, digest = await save_upload(image, original_path)
+
+        # Almacén direccionado por contenido: una imagen ya subida no se vuelve a transcodificar.
+        # El post se lleva una referencia al blob
+        try:
+            image_variants = await blob_store.put(original_path, digest)
+        except InvalidImageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            os.remove(original_path)
+        image_blob = digest
+        print(f"Image stored as blob {image_blob}")
         # Create relative path for database
-        relative_path = f"/uploads/{unique_filename}"
+        relative_path = image_variants["full"]
+
         
         post_doc = {
             "author_id": user_id,
             "author_username": username,
+            "author_private": profile["private_account"],
             "image_url": relative_path,
+            "image_variants": image_variants,
+            "image_blob": image_blob,
             "caption": caption,
             "timestamp": datetime.utcnow().isoformat(),
             "likes_count": 0,
@@ -103,29 +79,29 @@ async def create_post(
         
         result = await posts_collection.insert_one(post_doc)
         post_doc["id"] = str(result.inserted_id)
+
+        # Repartir el post en los timelines de los seguidores (modo timeline)
+        background_tasks.add_task(fan_out_post, post_doc, profile["followers_count"])
+
+        # Precalcular sugerencias de comentario con IA en segundo plano
+        if AI_PRECOMPUTE:
+            ai_jobs.enqueue({"post_id": post_doc["id"], "image_path": upload_path(image_variants["feed"])})
         
-        return PostResponse(**post_doc)
+        return PostResponse(**post_doc, author_profile_image_url=author_image_url(profile))
     except Exception as e:
-        # If there's an error, clean up the uploaded file if it exists
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+        # If there's an error, release the stored image
+        if image_blob:
+            await blob_store.release(image_blob)
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/posts/{post_id}")
-async def delete_post(post_id: str, authorization: str | None = Header(default=None, alias="Authorization")):
+async def delete_post(
+    post_id: str,
+    user_data: dict = Depends(get_current_user)
+):
     try:
-        if not authorization:
-            raise HTTPException(
-                status_code=401,
-                detail="Authorization header is required. Use format: Bearer <token>"
-            )
-
-        if authorization.startswith("Bearer "):
-            token = authorization.split(" ")[1]
-        else:
-            token = authorization
-
-        user_data = decode_token(token)
         user_id = user_data["user_id"]
 
         # Verificar si el post existe
@@ -137,14 +113,11 @@ async def delete_post(post_id: str, authorization: str | None = Header(default=N
         if post["author_id"] != user_id:
             raise HTTPException(status_code=403, detail="Not authorized to delete this post")
 
-        # Eliminar el archivo de imagen
-        image_path = os.path.join(UPLOAD_DIR, post["image_url"])  # Ajusta la ruta según sea necesario
-        print(f"Attempting to delete image at: {image_path}")
-        if os.path.exists(image_path):
-            os.remove(image_path)
-
-        # Eliminar el post
+        # La imagen, los comentarios, likes, guardados y timelines los borra el recolector
+        # en segundo plano; el trabajo se registra antes de borrar el post para no perderlo
+        await garbage_collector.enqueue_post(post)
         await posts_collection.delete_one({"_id": ObjectId(post_id)})
+        garbage_collector.wake()
         return {"message": "Post and image deleted successfully"}
 
     except HTTPException as e:
@@ -153,77 +126,48 @@ async def delete_post(post_id: str, authorization: str | None = Header(default=N
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/posts", response_model=List[PostResponse])
-async def get_all_posts(authorization: str | None = Header(default=None, alias="Authorization")):
+async def get_all_posts(
+    response: Response,
+    background_tasks: BackgroundTasks,
+    before: str | None = Query(default=None, description="Cursor <timestamp>,<post_id> from X-Next-Cursor"),
+    limit: int = Query(default=100, ge=1, le=100),
+    user_data: dict = Depends(get_current_user),
+    loader: UserLoader = Depends(get_user_loader)
+):
     try:
-        if not authorization:
-            raise HTTPException(
-                status_code=401, 
-                detail="Authorization header is required. Use format: Bearer <token>"
-            )
+        user_id = user_data["user_id"]
         
+        # Obtener la lista de usuarios que el usuario actual sigue
+        current_user = await profile_cache.get(user_id)
+        if not current_user:
+            raise HTTPException(status_code=401, detail="User not found")
+        following = current_user["following"]
+
         try:
-            if authorization.startswith("Bearer "):
-                token = authorization.split(" ")[1]
+            if TIMELINE_MODE:
+                # Timeline precalculado: un único rango indexado por usuario
+                # El cursor sale de las filas leídas, no de los posts que siguen existiendo
+                posts, next_cursor = await read_timeline(user_id, following, before, limit)
+                if not before:
+                    background_tasks.add_task(trim_timeline, user_id)
             else:
-                token = authorization
-                
-            user_data = decode_token(token)
-        except HTTPException as he:
-            raise he
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid authentication token")
+                # La visibilidad se resuelve en la consulta gracias a author_private
+                query = visibility_filter(user_id, following)
+                if before:
+                    query = {"$and": [query, before_cursor_filter(before)]}
+                posts = await posts_collection.find(query).sort(FEED_SORT).to_list(limit)
+                next_cursor = encode_cursor(posts[-1]) if len(posts) == limit else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+
+        response_posts = await assemble_feed(posts, user_id, loader)
 
-        user_id = user_data["user_id"]
-        
-        # Obtener la lista de usuarios que el usuario actual sigue
-        current_user = await users_collection.find_one({"_id": ObjectId(user_id)})
-        following = current_user.get("following", [])
-        
-        # Obtener todos los posts y filtrar
-        posts = await posts_collection.find().sort("timestamp", -1).to_list(100)
-        
-        response_posts = []
-        for post in posts:
-            try:
-                # Obtener información del autor del post
-                post_author = await users_collection.find_one({"_id": ObjectId(post["author_id"])})
-                
-                # Verificar si debemos incluir este post:
-                # - Si la cuenta no es privada, incluir
-                # - Si la cuenta es privada y el usuario sigue al autor, incluir
-                # - Si el post es del usuario actual, incluir
-                if (not post_author.get("private_account", False) or 
-                    post["author_id"] in following or 
-                    post["author_id"] == user_id):
-                    
-                    is_liked = await likes_collection.find_one({
-                        "user_id": user_id,
-                        "post_id": str(post["_id"])
-                    }) is not None
-                    
-                    is_saved = await saved_posts_collection.find_one({
-                        "user_id": user_id,
-                        "post_id": str(post["_id"])
-                    }) is not None
-                    
-                    post_dict = {
-                        "id": str(post["_id"]),
-                        "author_id": post.get("author_id", ""),
-                        "author_username": post.get("author_username", ""),
-                        "image_url": post.get("image_url", ""),
-                        "caption": post.get("caption", ""),
-                        "timestamp": post.get("timestamp", ""),
-                        "likes_count": post.get("likes_count", 0),
-                        "comments_count": post.get("comments_count", 0),
-                        "is_liked": is_liked,
-                        "is_saved": is_saved
-                    }
-                    response_posts.append(post_dict)
-            except Exception as post_error:
-                print(f"Error processing post {post.get('_id', 'unknown')}: {str(post_error)}")
-                continue
-            
         return response_posts
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Error in get_all_posts: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -232,48 +176,31 @@ async def get_all_posts(authorization: str | None = Header(default=None, alias="
 @router.get("/posts/{user_id}", response_model=List[PostResponse])
 async def get_user_posts(
     user_id: str,
-    authorization: str | None = Header(default=None, alias="Authorization")
+    user_data: dict = Depends(get_current_user),
+    loader: UserLoader = Depends(get_user_loader)
 ):
     try:
-        if not authorization:
-            raise HTTPException(
-                status_code=401, 
-                detail="Authorization header is required. Use format: Bearer <token>"
-            )
-        
-        try:
-            if authorization.startswith("Bearer "):
-                token = authorization.split(" ")[1]
-            else:
-                token = authorization
-                
-            user_data = decode_token(token)
-        except HTTPException as he:
-            raise he
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid authentication token")
-
         current_user_id = user_data["user_id"]
-        posts = await posts_collection.find({"author_id": user_id}).sort("timestamp", -1).to_list(100)
+        posts, author = await asyncio.gather(
+            posts_collection.find({"author_id": user_id}).sort("timestamp", -1).to_list(100),
+            loader.load(user_id)
+        )
         
+        liked, saved = await fetch_viewer_flags(current_user_id, [str(post["_id"]) for post in posts])
+
         response_posts = []
         for post in posts:
-            is_liked = await likes_collection.find_one({
-                "user_id": current_user_id,
-                "post_id": str(post["_id"])
-            }) is not None
-            
-            
-            is_saved = await saved_posts_collection.find_one({
-                "user_id": current_user_id,
-                "post_id": str(post["_id"])
-            }) is not None
+            post = post_counters.overlay(post)
+            is_liked = str(post["_id"]) in liked
+            is_saved = str(post["_id"]) in saved
             
             post_dict = {
                 "id": str(post["_id"]),
                 "author_id": post["author_id"],
                 "author_username": post["author_username"],
+                "author_profile_image_url": author_image_url(author),
                 "image_url": post["image_url"],
+                "image_variants": post.get("image_variants"),
                 "caption": post["caption"],
                 "timestamp": post["timestamp"],
                 "likes_count": post["likes_count"],
@@ -289,26 +216,12 @@ async def get_user_posts(
 
 
 @router.get("/getposts/{post_id}", response_model=PostResponse)
-async def get_post(post_id: str, authorization: str | None = Header(default=None, alias="Authorization")):
+async def get_post(
+    post_id: str,
+    user_data: dict = Depends(get_current_user),
+    loader: UserLoader = Depends(get_user_loader)
+):
     try:
-        if not authorization:
-            raise HTTPException(
-                status_code=401,
-                detail="Authorization header is required. Use format: Bearer <token>"
-            )
-
-        try:
-            if authorization.startswith("Bearer "):
-                token = authorization.split(" ")[1]
-            else:
-                token = authorization
-
-            user_data = decode_token(token)
-        except HTTPException as he:
-            raise he
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid authentication token")
-
         user_id = user_data["user_id"]
 
         # Check if post exists
@@ -319,6 +232,9 @@ async def get_post(post_id: str, authorization: str | None = Header(default=None
                 detail="Post not found"
             )
 
+        post = post_counters.overlay(post)
+        author = await loader.load(post["author_id"])
+
         # Check if current user liked this post
         is_liked = await likes_collection.find_one({
             "user_id": user_id,
@@ -335,7 +251,9 @@ async def get_post(post_id: str, authorization: str | None = Header(default=None
             "id": str(post["_id"]),
             "author_id": post["author_id"],
             "author_username": post["author_username"],
+            "author_profile_image_url": author_image_url(author),
             "image_url": post["image_url"],
+            "image_variants": post.get("image_variants"),
             "caption": post["caption"],
             "timestamp": post["timestamp"],
             "likes_count": post["likes_count"],
@@ -356,64 +274,37 @@ async def get_post(post_id: str, authorization: str | None = Header(default=None
 @router.post("/posts/{post_id}/like")
 async def like_post(
     post_id: str, 
-    authorization: str | None = Header(default=None, alias="Authorization")
+    user_data: dict = Depends(get_current_user)
 ):
     try:
-        if not authorization:
-            raise HTTPException(
-                status_code=401, 
-                detail="Authorization header is required. Use format: Bearer <token>"
-            )
-        
+        user_id = user_data["user_id"]
+        post_oid = ObjectId(post_id)
+
+        # El índice único (user_id, post_id) decide si es like o unlike, y el
+        # contador solo se modifica si el insert/delete realmente tuvo efecto
+        like_doc = {
+            "user_id": user_id,
+            "post_id": post_id,
+            "timestamp": datetime.utcnow().isoformat()
+        }
         try:
-            if authorization.startswith("Bearer "):
-                token = authorization.split(" ")[1]
-            else:
-                token = authorization
-                
-            user_data = decode_token(token)
-        except HTTPException as he:
-            raise he  # Propagate 401 from decode_token
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid authentication token")
+            await likes_collection.insert_one(like_doc)
+        except DuplicateKeyError:
+            # Unlike
+            result = await likes_collection.delete_one({"user_id": user_id, "post_id": post_id})
+            if result.deleted_count:
+                post_counters.add(post_id, "likes_count", -1)
+            return {"message": "Post unliked"}
 
-        user_id = user_data["user_id"]
-        
-        # Check if post exists
-        post = await posts_collection.find_one({"_id": ObjectId(post_id)})
-        if not post:
+        # Like
+        if not await posts_collection.find_one({"_id": post_oid}, {"_id": 1}):
+            await likes_collection.delete_one({"user_id": user_id, "post_id": post_id})
             raise HTTPException(
                 status_code=404,
                 detail="Post not found"
             )
-        
-        # Check if already liked
-        existing_like = await likes_collection.find_one({
-            "user_id": user_id,
-            "post_id": post_id
-        })
-        
-        if existing_like:
-            # Unlike
-            await likes_collection.delete_one({"_id": existing_like["_id"]})
-            await posts_collection.update_one(
-                {"_id": ObjectId(post_id)},
-                {"$inc": {"likes_count": -1}}
-            )
-            return {"message": "Post unliked"}
-        else:
-            # Like
-            like_doc = {
-                "user_id": user_id,
-                "post_id": post_id,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            await likes_collection.insert_one(like_doc)
-            await posts_collection.update_one(
-                {"_id": ObjectId(post_id)},
-                {"$inc": {"likes_count": 1}}
-            )
-            return {"message": "Post liked"}
+        post_counters.add(post_id, "likes_count", 1)
+        return {"message": "Post liked"}
     except HTTPException as e:
         # Re-raise HTTPException to ensure 401, 404, etc., are returned correctly
         raise e
@@ -426,29 +317,14 @@ async def like_post(
 async def add_comment(
     post_id: str, 
     comment: str = Form(...),
-    authorization: str | None = Header(default=None, alias="Authorization")
+    user_data: dict = Depends(get_current_user)
 ):
     try:
-        if not authorization:
-            raise HTTPException(
-                status_code=401, 
-                detail="Authorization header is required. Use format: Bearer <token>"
-            )
-        
-        try:
-            if authorization.startswith("Bearer "):
-                token = authorization.split(" ")[1]
-            else:
-                token = authorization
-                
-            user_data = decode_token(token)
-        except HTTPException as he:
-            raise he  # Propagate 401 from decode_token
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid authentication token")
-
         user_id = user_data["user_id"]
-        username = user_data["username"]
+        profile = await profile_cache.get(user_id)
+        if not profile:
+            raise HTTPException(status_code=401, detail="User not found")
+        username = profile["username"]
         
         comment_doc = {
             "post_id": post_id,
@@ -459,10 +335,7 @@ async def add_comment(
         }
         
         result = await comments_collection.insert_one(comment_doc)
-        await posts_collection.update_one(
-            {"_id": ObjectId(post_id)},
-            {"$inc": {"comments_count": 1}}
-        )
+        post_counters.add(post_id, "comments_count", 1)
         
         comment_doc["id"] = str(result.inserted_id)
         return CommentResponse(**comment_doc)
@@ -479,51 +352,32 @@ async def get_post_comments(post_id: str):
 
 
 @router.post("/posts/{post_id}/save")
-async def save_post(post_id: str, authorization: str | None = Header(default=None, alias="Authorization")):
+async def save_post(post_id: str, user_data: dict = Depends(get_current_user)):
     try:
-        if not authorization:
-            raise HTTPException(
-                status_code=401,
-                detail="Se requiere el encabezado de autorización"
-            )
-        
-        try:
-            if authorization.startswith("Bearer "):
-                token = authorization.split(" ")[1]
-            else:
-                token = authorization
-                
-            user_data = decode_token(token)
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Token de autenticación inválido")
-
         user_id = user_data["user_id"]
-        
-        # Verificar si el post existe
-        post = await posts_collection.find_one({"_id": ObjectId(post_id)})
-        if not post:
-            raise HTTPException(status_code=404, detail="Post no encontrado")
-        
-        # Verificar si ya está guardado
-        saved_post = await saved_posts_collection.find_one({
+        post_oid = ObjectId(post_id)
+
+        # El índice único (user_id, post_id) decide si se guarda o se elimina
+        saved_post_doc = {
             "user_id": user_id,
-            "post_id": post_id
-        })
-        
-        if saved_post:
+            "post_id": post_id,
+            "saved_at": datetime.utcnow().isoformat()
+        }
+        try:
+            await saved_posts_collection.insert_one(saved_post_doc)
+        except DuplicateKeyError:
             # Si ya está guardado, lo eliminamos
-            await saved_posts_collection.delete_one({"_id": saved_post["_id"]})
+            await saved_posts_collection.delete_one({"user_id": user_id, "post_id": post_id})
             return {"message": "Post eliminado de guardados", "is_saved": False}
-        else:
-            # Si no está guardado, lo guardamos
-            saved_post_doc = {
-                "user_id": user_id,
-                "post_id": post_id,
-                "saved_at": datetime.utcnow().isoformat()
-            }
-            await saved_posts_collection.insert_one(saved_post_doc)
-            return {"message": "Post guardado exitosamente", "is_saved": True}
+
+        # Verificar que el post existe
+        if not await posts_collection.find_one({"_id": post_oid}, {"_id": 1}):
+            await saved_posts_collection.delete_one({"user_id": user_id, "post_id": post_id})
+            raise HTTPException(status_code=404, detail="Post no encontrado")
+        return {"message": "Post guardado exitosamente", "is_saved": True}
             
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Error al guardar/eliminar post: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -531,25 +385,10 @@ async def save_post(post_id: str, authorization: str | None = Header(default=Non
 @router.get("/posts/saved/{user_id}", response_model=List[PostResponse])
 async def get_saved_posts(
     user_id: str,
-    authorization: str | None = Header(default=None, alias="Authorization")
+    user_data: dict = Depends(get_current_user),
+    loader: UserLoader = Depends(get_user_loader)
 ):
     try:
-        if not authorization:
-            raise HTTPException(
-                status_code=401,
-                detail="Se requiere el encabezado de autorización"
-            )
-        
-        try:
-            if authorization.startswith("Bearer "):
-                token = authorization.split(" ")[1]
-            else:
-                token = authorization
-                
-            user_data = decode_token(token)
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Token de autenticación inválido")
-
         current_user_id = user_data["user_id"]
         
         # Obtener los posts guardados del usuario
@@ -559,12 +398,13 @@ async def get_saved_posts(
         # Obtener los detalles completos de los posts guardados
         posts = await posts_collection.find({"_id": {"$in": saved_post_ids}}).to_list(100)
         
+        liked, _ = await fetch_viewer_flags(current_user_id, [str(post["_id"]) for post in posts])
+        authors = await loader.load_many(post["author_id"] for post in posts)
+
         response_posts = []
         for post in posts:
-            is_liked = await likes_collection.find_one({
-                "user_id": current_user_id,
-                "post_id": str(post["_id"])
-            }) is not None
+            post = post_counters.overlay(post)
+            is_liked = str(post["_id"]) in liked
             
             is_saved = True  # Ya sabemos que está guardado
             
@@ -572,7 +412,9 @@ async def get_saved_posts(
                 "id": str(post["_id"]),
                 "author_id": post["author_id"],
                 "author_username": post["author_username"],
+                "author_profile_image_url": author_image_url(authors.get(post["author_id"])),
                 "image_url": post["image_url"],
+                "image_variants": post.get("image_variants"),
                 "caption": post["caption"],
                 "timestamp": post["timestamp"],
                 "likes_count": post["likes_count"],
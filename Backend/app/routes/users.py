@@ -1,18 +1,97 @@
-from fastapi import APIRouter, HTTPException, Query, File, UploadFile
+from fastapi import APIRouter, HTTPException, Query, File, UploadFile, BackgroundTasks, Response, Depends
+from fastapi.responses import StreamingResponse
 from typing import List
-from ..models.user import UserCreate, UserResponse, UserLogin, FriendRequest, RequestStatus
-from ..utils.auth import pwd_context, create_access_token
-from ..database import friend_requests_collection, users_collection
+from ..models.user import UserCreate, UserResponse, UserSummary, UserLogin, FriendRequest
+from ..utils.auth import hash_password, verify_password, create_access_token, session_claims, token_cache, get_admin_user
+from ..utils.profile_cache import profile_cache
+from ..utils.user_search import search_index, search_cache, normalize_username, search_users as find_users
+from ..utils.timeline import backfill_follow, remove_follow
+from ..utils.follows import add_follow, delete_follow, send_follow_request, is_following, list_follows, enrich_follow_requests, FOLLOW_PAGE_SIZE
+from ..utils.counters import user_counters
+from ..utils.loaders import UserLoader, get_user_loader
+from ..utils.uploads import save_upload, temp_upload_path
+from ..utils.images import variant_urls, InvalidImageError
+from ..utils.blobs import blob_store, blob_digest
+from ..utils.cleanup import garbage_collector
+from ..database import friend_requests_collection, users_collection, posts_collection
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+import asyncio
 import os
-import shutil
 from app.models.user import UserUpdate
 import re
+import json
 from datetime import datetime
 
 router = APIRouter()
 
+USER_LIST_PROJECTION = {
+    "username": 1,
+    "email": 1,
+    "profile_image_url": 1,
+    "profile_image_variants": 1,
+    "phone": 1,
+    "birth_date": 1,
+    "private_account": 1,
+    "followers_count": 1,
+    "following_count": 1
+}
+# Listados públicos (GET /users, seguidores, seguidos): sin datos de contacto
+USER_SUMMARY_PROJECTION = {
+    "username": 1,
+    "profile_image_url": 1,
+    "profile_image_variants": 1,
+    "private_account": 1,
+    "followers_count": 1,
+    "following_count": 1
+}
+USER_EXPORT_BATCH_SIZE = 500
+
+def to_user_response(user: dict, is_following: bool | None = None) -> UserResponse:
+    user = user_counters.overlay(user)
+    return UserResponse(
+        id=str(user["_id"]),
+        username=user["username"],
+        email=user["email"],
+        profile_image_url=user.get("profile_image_url"),
+        profile_image_variants=user.get("profile_image_variants"),
+        phone=user.get("phone"),
+        birth_date=user.get("birth_date"),
+        followers_count=user.get("followers_count", 0),
+        following_count=user.get("following_count", 0),
+        private_account=user.get("private_account", False),
+        is_following=is_following
+    )
+
+def to_user_summary(user: dict) -> dict:
+    user = user_counters.overlay(user)
+    return {
+        "id": str(user["_id"]),
+        "username": user["username"],
+        "profile_image_url": user.get("profile_image_url"),
+        "profile_image_variants": user.get("profile_image_variants"),
+        "private_account": user.get("private_account", False),
+        "followers_count": user.get("followers_count", 0),
+        "following_count": user.get("following_count", 0)
+    }
+
+def to_user_export(user: dict) -> dict:
+    """Line of the admin NDJSON export: the public summary plus contact details."""
+    return {
+        **to_user_summary(user),
+        "email": user.get("email"),
+        "phone": user.get("phone"),
+        "birth_date": user.get("birth_date")
+    }
+
+def after_id_filter(after: str | None) -> dict:
+    if not after:
+        return {}
+    if not ObjectId.is_valid(after):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"_id": {"$gt": ObjectId(after)}}
+
 @router.post("/register", response_model=UserResponse)
 async def register(user: UserCreate):
     # Check if username already exists
@@ -46,40 +125,41 @@ async def register(user: UserCreate):
         if age < 13:
             raise HTTPException(status_code=400, detail="User must be at least 13 years old")
     
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await hash_password(user.password)
     
     user_doc = {
         "username": user.username,
+        "username_lower": normalize_username(user.username),
         "password": hashed_password,
         "email": user.email,
         "phone": user.phone,
         "birth_date": user.birth_date,
         "profile_image_url": user.profile_image_url,
-        "followers": [],
-        "following": [],
+        "followers_count": 0,
+        "following_count": 0,
         "private_account": user.private_account
     }
     
     result = await users_collection.insert_one(user_doc)
     
-    # Create token data
-    token_data = {
-        "user_id": str(result.inserted_id),
+    user_id = str(result.inserted_id)
+    search_index.add(user_id, user.username, 0)
+    search_cache.clear()
+    
+    # Create non-expiring token (solo user_id, sesión y fecha de emisión)
+    access_token = create_access_token(session_claims(user_id), no_expiry=True)
+    
+    response_doc = {
+        "id": user_id,
         "username": user_doc["username"],
         "email": user_doc["email"],
         "phone": user_doc["phone"],
         "birth_date": user_doc["birth_date"],
         "profile_image_url": user_doc["profile_image_url"],
-        "followers": user_doc["followers"],
-        "following": user_doc["following"],
-        "private_account": False
+        "followers_count": 0,
+        "following_count": 0,
+        "private_account": user_doc["private_account"]
     }
-    
-    # Create non-expiring token
-    access_token = create_access_token(token_data, no_expiry=True)
-    
-    response_doc = token_data.copy()
-    response_doc["id"] = token_data["user_id"]
     response_doc["access_token"] = access_token
     response_doc["token_type"] = "bearer"
     return UserResponse(**response_doc)
@@ -87,103 +167,102 @@ async def register(user: UserCreate):
 @router.post("/login")
 async def login(user: UserLogin):
     db_user = await users_collection.find_one({"username": user.username})
-    if not db_user or not pwd_context.verify(user.password, db_user["password"]):
+    if not db_user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
+
+    valid, new_hash = await verify_password(user.password, db_user["password"])
+    if not valid:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+
+    # Rehash transparente si cambió el coste de bcrypt
+    if new_hash:
+        await users_collection.update_one({"_id": db_user["_id"]}, {"$set": {"password": new_hash}})
     
-    token_data = {
-        "user_id": str(db_user["_id"]),
-        "profile_image_url": db_user.get("profile_image_url"),
-        "phone": db_user.get("phone"),
-        "birth_date": db_user.get("birth_date"),
-        "followers": db_user.get("followers", []),
-        "following": db_user.get("following", []),
-        "email": db_user["email"],
-        "username": db_user["username"],
-        "private_account": db_user.get("private_account", False)
-    }
-    
-    # Create non-expiring token
-    access_token = create_access_token(token_data, no_expiry=True)
+    # Create non-expiring token (solo user_id, sesión y fecha de emisión)
+    access_token = create_access_token(session_claims(str(db_user["_id"])), no_expiry=True)
     return {"access_token": access_token, "token_type": "bearer"}
 
-@router.get("/users", response_model=List[UserResponse])
-async def get_users():
-    users = await users_collection.find().to_list(1000)
-    response_users = []
-    for user in users:
-        response_users.append({
-            "id": str(user["_id"]),
-            "username": user["username"],
-            "email": user["email"],
-            "profile_image_url": user.get("profile_image_url"),
-            "phone": user.get("phone"),
-            "birth_date": user.get("birth_date"),
-            "followers": user.get("followers", []),
-            "following": user.get("following", []),
-            "private_account": user.get("private_account", False)
-        })
-    
-    return [UserResponse(**user) for user in response_users]
+@router.get("/auth/token-cache/stats")
+async def get_token_cache_stats(admin: dict = Depends(get_admin_user)):
+    return token_cache.get_stats()
+
+@router.get("/users", response_model=List[UserSummary])
+async def get_users(
+    response: Response,
+    after: str | None = Query(default=None, description="Cursor (last user id) from X-Next-Cursor"),
+    limit: int = Query(default=50, ge=1, le=200)
+):
+    query = after_id_filter(after)
+    cursor = users_collection.find(query, USER_SUMMARY_PROJECTION).sort("_id", 1)
+    users = await cursor.limit(limit).to_list(limit)
+    if len(users) == limit:
+        response.headers["X-Next-Cursor"] = str(users[-1]["_id"])
+    return [to_user_summary(user) for user in users]
+
+@router.get("/users/export")
+async def export_users(
+    after: str | None = Query(default=None, description="Resume the export after this user id"),
+    admin: dict = Depends(get_admin_user)
+):
+    """
+    NDJSON export of every user, ordered by id, for admins only.
+
+    Unlike GET /users it includes the contact data (email, phone, birth_date)
+    on purpose: it is the data dump used for support and backups.
+    """
+    cursor = users_collection.find(after_id_filter(after), USER_LIST_PROJECTION).sort("_id", 1)
+
+    # Se recorre el cursor por lotes, la memoria no crece con el número de usuarios
+    async def export():
+        async for user in cursor.batch_size(USER_EXPORT_BATCH_SIZE):
+            yield json.dumps(to_user_export(user), default=str) + "\n"
+
+    return StreamingResponse(export(), media_type="application/x-ndjson")
+
+@router.get("/users/search/stats")
+async def get_search_stats(admin: dict = Depends(get_admin_user)):
+    return {**search_cache.get_stats(), "index": search_index.get_stats()}
 
 @router.get("/users/search", response_model=List[UserResponse])
-async def search_users(username: str = Query(..., min_length=1)):
+async def search_users(username: str = Query(..., min_length=1), limit: int = Query(default=20, ge=1, le=50)):
     try:
-        search_pattern = f".*{username}.*"
-        print(f"Searching with pattern: {search_pattern}")
-        
-        users = await users_collection.find({
-            "username": {"$regex": search_pattern, "$options": "i"}
-        }).limit(20).to_list(20)
+        # Prefijo por índice + trigramas en memoria, ordenado por relevancia y seguidores.
+        # Los resultados se cachean unos segundos y las peticiones iguales se agrupan
+        users = await find_users(username, limit)
         
         print(f"Found {len(users)} users")
         
-        response_users = []
-        for user in users:
-            response_users.append({
-                "id": str(user["_id"]),
-                "username": user["username"],
-                "email": user["email"],
-                "profile_image_url": user.get("profile_image_url"),
-                "phone": user.get("phone"),
-                "birth_date": user.get("birth_date"),
-                "followers": user.get("followers", []),
-                "following": user.get("following", [])
-            })
-        
-        return [UserResponse(**user) for user in response_users]
+        return [to_user_response(user) for user in users]
     except Exception as e:
         print(f"Error in search: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/users/{user_id}", response_model=UserResponse)
-async def get_user_profile(user_id: str):
+async def get_user_profile(
+    user_id: str,
+    current_user_id: str | None = Query(default=None),
+    loader: UserLoader = Depends(get_user_loader)
+):
     try:
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        user = await loader.load(user_id)
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        return UserResponse(
-            id=str(user["_id"]),
-            username=user["username"],
-            email=user["email"],
-            profile_image_url=user.get("profile_image_url"),
-            phone=user.get("phone"),
-            birth_date=user.get("birth_date"),
-            followers=user.get("followers", []),
-            following=user.get("following", []),
-            private_account=user.get("private_account", False)
-        )
+        following = await is_following(current_user_id, user_id) if current_user_id else None
+        return to_user_response(user, following)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Error getting user profile: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/users/{user_id}/profile", response_model=UserResponse)
-async def update_profile(user_id: str, user_data: UserUpdate):
+async def update_profile(user_id: str, user_data: UserUpdate, loader: UserLoader = Depends(get_user_loader)):
     try:
         # Verify user exists
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        user = await loader.load(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -195,27 +274,27 @@ async def update_profile(user_id: str, user_data: UserUpdate):
         
         if "private_account" in update_data:
             update_data["private_account"] = update_data["private_account"]
+
+        # Las variantes y el blob los calcula el servidor a partir de profile_image_url
+        update_data.pop("profile_image_variants", None)
+        update_data.pop("profile_image_blob", None)
         
         if not update_data:
             raise HTTPException(status_code=400, detail="No data to update")
 
+        if "username" in update_data:
+            update_data["username_lower"] = normalize_username(update_data["username"])
+
         # Handle profile image update
         if "profile_image_url" in update_data:
             # Asegurarse de que la ruta de la imagen comience con /uploads/
             if not update_data["profile_image_url"].startswith("/uploads/"):
                 update_data["profile_image_url"] = f"/uploads/{update_data['profile_image_url'].split('/')[-1]}"
+            update_data["profile_image_variants"] = variant_urls(update_data["profile_image_url"])
 
-            # Solo intentar eliminar la imagen anterior si existe y es diferente a la nueva
-            old_image_path = user.get("profile_image_url")
-            if old_image_path and old_image_path != update_data["profile_image_url"]:
-                try:
-                    file_name = old_image_path.replace("/uploads/", "")
-                    full_path = os.path.join("uploads", file_name)
-                    if os.path.exists(full_path):
-                        os.remove(full_path)
-                except Exception as e:
-                    print(f"Error al eliminar imagen anterior: {str(e)}")
-                    # Continuamos con la actualización incluso si falla la eliminación
+            # Imágenes del almacén de blobs: referencia a la nueva; la anterior la limpia
+            # el recolector en segundo plano una vez actualizado el usuario
+            update_data["profile_image_blob"] = blob_digest(update_data["profile_image_url"])
 
         # Validate email if provided
         if "email" in update_data:
@@ -228,152 +307,161 @@ async def update_profile(user_id: str, user_data: UserUpdate):
             if existing_user:
                 raise HTTPException(status_code=409, detail="Email already registered")
 
-        # Update user profile
-        result = await users_collection.update_one(
+        new_blob = update_data.get("profile_image_blob")
+        old_blob = user.get("profile_image_blob")
+        blob_changed = "profile_image_url" in update_data and new_blob != old_blob
+        if blob_changed and new_blob and not await blob_store.acquire(new_blob):
+            raise HTTPException(status_code=400, detail="Image not found, upload it again")
+
+        # Actualizar y leer el documento resultante en una sola operación
+        updated_user = await users_collection.find_one_and_update(
             {"_id": ObjectId(user_id)},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection=USER_LIST_PROJECTION,
+            return_document=ReturnDocument.AFTER
         )
-        
-        if result.modified_count == 0:
-            # En lugar de lanzar una excepción, simplemente devolvemos los datos actuales del usuario
-            updated_user = await users_collection.find_one({"_id": ObjectId(user_id)})
-            return UserResponse(
-                id=str(updated_user["_id"]),
-                username=updated_user["username"],
-                email=updated_user["email"],
-                profile_image_url=updated_user.get("profile_image_url"),
-                phone=updated_user.get("phone"),
-                birth_date=updated_user.get("birth_date"),
-                followers=updated_user.get("followers", []),
-                following=updated_user.get("following", []),
-                private_account=updated_user.get("private_account", False)
-            )
+        if not updated_user:
+            if blob_changed:
+                await blob_store.release(new_blob)
+            raise HTTPException(status_code=404, detail="User not found")
+        loader.prime(updated_user)
+        old_image_url = user.get("profile_image_url")
+        if "profile_image_url" in update_data and old_image_url != update_data["profile_image_url"]:
+            try:
+                await garbage_collector.enqueue_image(old_image_url, old_blob if blob_changed else None)
+            except Exception as e:
+                print(f"Error al programar la limpieza de la imagen anterior: {str(e)}")
+                # Continuamos con la actualización aunque no se pueda programar la limpieza
+
+        profile_cache.invalidate(user_id)
+        if "username" in update_data:
+            search_index.add(user_id, update_data["username"])
+            search_cache.clear()
 
-        # Get updated user data
-        updated_user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        # Mantener sincronizada la copia desnormalizada en los posts del autor
+        if "private_account" in update_data:
+            await posts_collection.update_many(
+                {"author_id": user_id},
+                {"$set": {"author_private": update_data["private_account"]}}
+            )
         
-        return UserResponse(
-            id=str(updated_user["_id"]),
-            username=updated_user["username"],
-            email=updated_user["email"],
-            profile_image_url=updated_user.get("profile_image_url"),
-            phone=updated_user.get("phone"),
-            birth_date=updated_user.get("birth_date"),
-            followers=updated_user.get("followers", []),
-            following=updated_user.get("following", []),
-            private_account=updated_user.get("private_account", False)
-        )
+        return to_user_response(updated_user)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/{user_id}/follow", response_model=UserResponse)
-async def follow_user(user_id: str, current_user_id: str):
+async def follow_user(
+    user_id: str,
+    current_user_id: str,
+    background_tasks: BackgroundTasks,
+    loader: UserLoader = Depends(get_user_loader)
+):
     try:
-        user_to_follow = await users_collection.find_one({"_id": ObjectId(user_id)})
-        if not user_to_follow:
-            raise HTTPException(status_code=404, detail="User to follow not found")
-
-        current_user = await users_collection.find_one({"_id": ObjectId(current_user_id)})
-        if not current_user:
-            raise HTTPException(status_code=404, detail="Current user not found")
-
         if user_id == current_user_id:
             raise HTTPException(status_code=400, detail="You cannot follow yourself")
+        if not ObjectId.is_valid(user_id) or not ObjectId.is_valid(current_user_id):
+            raise HTTPException(status_code=404, detail="User not found")
+
+        # Dos operaciones: leer ambos usuarios en un lote y escribir la arista o la solicitud.
+        # Los contadores van por el buffer de escritura diferida
+        users = await loader.load_many([user_id, current_user_id])
+        if current_user_id not in users:
+            raise HTTPException(status_code=404, detail="Current user not found")
+        user_to_follow = users.get(user_id)
+        if not user_to_follow:
+            raise HTTPException(status_code=404, detail="User to follow not found")
 
         if user_to_follow.get("private_account", False):
-            existing_request = await friend_requests_collection.find_one({
-                "sender_id": current_user_id,
-                "receiver_id": user_id,
-                "status": RequestStatus.PENDING
-            })
-            
-            if existing_request:
+            if not await send_follow_request(current_user_id, user_id):
                 raise HTTPException(status_code=400, detail="Follow request already sent")
-            
-            request_doc = {
-                "sender_id": current_user_id,
-                "receiver_id": user_id,
-                "status": RequestStatus.PENDING,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            await friend_requests_collection.insert_one(request_doc)
-        else:
-            if current_user_id not in user_to_follow.get("followers", []):
-                await users_collection.update_one(
-                    {"_id": ObjectId(user_id)},
-                    {"$addToSet": {"followers": current_user_id}}
-                )
-            if user_id not in current_user.get("following", []):
-                await users_collection.update_one(
-                    {"_id": ObjectId(current_user_id)},
-                    {"$addToSet": {"following": user_id}}
-                )
-
-        updated_user = await users_collection.find_one({"_id": ObjectId(user_id)})
-        return UserResponse(
-            id=str(updated_user["_id"]),
-            username=updated_user["username"],
-            email=updated_user["email"],
-            profile_image_url=updated_user.get("profile_image_url"),
-            phone=updated_user.get("phone"),
-            birth_date=updated_user.get("birth_date"),
-            followers=updated_user.get("followers", []),
-            following=updated_user.get("following", []),
-            private_account=updated_user.get("private_account", False)
-        )
+            return to_user_response(user_to_follow, False)
+
+        if await add_follow(current_user_id, user_id):
+            search_index.adjust_followers(user_id, 1)
+            profile_cache.invalidate(user_id, current_user_id)
+            background_tasks.add_task(backfill_follow, current_user_id, user_id)
+        return to_user_response(user_to_follow, True)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/{user_id}/unfollow", response_model=UserResponse)
-async def unfollow_user(user_id: str, current_user_id: str):
+async def unfollow_user(
+    user_id: str,
+    current_user_id: str,
+    background_tasks: BackgroundTasks,
+    loader: UserLoader = Depends(get_user_loader)
+):
     try:
-        # Verificar que el usuario a dejar de seguir existe
-        user_to_unfollow = await users_collection.find_one({"_id": ObjectId(user_id)})
-        if not user_to_unfollow:
-            raise HTTPException(status_code=404, detail="User to unfollow not found")
+        if not ObjectId.is_valid(user_id) or not ObjectId.is_valid(current_user_id):
+            raise HTTPException(status_code=404, detail="User not found")
 
-        # Verificar que el usuario actual existe
-        current_user = await users_collection.find_one({"_id": ObjectId(current_user_id)})
-        if not current_user:
+        # Leer ambos perfiles (un lote), borrar la arista y cancelar la solicitud pendiente
+        # en paralelo. La solicitud se cancela siempre, como antes, aunque la cuenta haya
+        # pasado a ser pública después de enviarla. Un usuario inexistente no puede tener
+        # aristas ni solicitudes, así que los borrados no hacen nada en ese caso
+        users, unfollowed, _ = await asyncio.gather(
+            loader.load_many([user_id, current_user_id]),
+            delete_follow(current_user_id, user_id),
+            friend_requests_collection.delete_one({
+                "sender_id": current_user_id,
+                "receiver_id": user_id,
+                "status": "pending"
+            })
+        )
+        if current_user_id not in users:
             raise HTTPException(status_code=404, detail="Current user not found")
+        user_to_unfollow = users.get(user_id)
+        if not user_to_unfollow:
+            raise HTTPException(status_code=404, detail="User to unfollow not found")
 
-        # Cancelar solicitud pendiente si existe
-        await friend_requests_collection.delete_one({
-            "sender_id": current_user_id,
-            "receiver_id": user_id,
-            "status": "pending"
-        })
+        if unfollowed:
+            search_index.adjust_followers(user_id, -1)
+            profile_cache.invalidate(user_id, current_user_id)
+            background_tasks.add_task(remove_follow, current_user_id, user_id)
 
-        # Actualizar la lista de seguidores y seguidos
-        if current_user_id in user_to_unfollow.get("followers", []):
-            await users_collection.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$pull": {"followers": current_user_id}}
-            )
-        if user_id in current_user.get("following", []):
-            await users_collection.update_one(
-                {"_id": ObjectId(current_user_id)},
-                {"$pull": {"following": user_id}}
-            )
-
-        # Retornar el perfil actualizado
-        updated_user = await users_collection.find_one({"_id": ObjectId(user_id)})
-        return UserResponse(
-            id=str(updated_user["_id"]),
-            username=updated_user["username"],
-            email=updated_user["email"],
-            profile_image_url=updated_user.get("profile_image_url"),
-            phone=updated_user.get("phone"),
-            birth_date=updated_user.get("birth_date"),
-            followers=updated_user.get("followers", []),
-            following=updated_user.get("following", []),
-            private_account=updated_user.get("private_account", False)
-        )
+        return to_user_response(user_to_unfollow, False)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _follow_page(user_id: str, direction: str, response: Response, after: str | None, limit: int) -> list:
+    try:
+        users, next_cursor = await list_follows(user_id, direction, after, limit, USER_SUMMARY_PROJECTION)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [to_user_summary(user) for user in users]
+
+@router.get("/users/{user_id}/followers", response_model=List[UserSummary])
+async def get_followers(
+    user_id: str,
+    response: Response,
+    after: str | None = Query(default=None, description="Cursor from X-Next-Cursor"),
+    limit: int = Query(default=FOLLOW_PAGE_SIZE, ge=1, le=200)
+):
+    return await _follow_page(user_id, "followers", response, after, limit)
+
+@router.get("/users/{user_id}/following", response_model=List[UserSummary])
+async def get_following(
+    user_id: str,
+    response: Response,
+    after: str | None = Query(default=None, description="Cursor from X-Next-Cursor"),
+    limit: int = Query(default=FOLLOW_PAGE_SIZE, ge=1, le=200)
+):
+    return await _follow_page(user_id, "following", response, after, limit)
+
 @router.get("/users/{user_id}/follow-request")
-async def check_follow_request(user_id: str, current_user_id: str = Query(...)):
+async def check_follow_request(
+    user_id: str,
+    current_user_id: str = Query(...),
+    loader: UserLoader = Depends(get_user_loader)
+):
     try:
         request = await friend_requests_collection.find_one({
             "sender_id": current_user_id,
@@ -382,179 +470,126 @@ async def check_follow_request(user_id: str, current_user_id: str = Query(...)):
         })
         
         if request:
-            # Get complete sender user data
-            sender = await users_collection.find_one({"_id": ObjectId(current_user_id)})
-            request["id"] = str(request["_id"])
-            request["sender"] = {
-                "id": str(sender["_id"]),
-                "username": sender["username"],
-                "email": sender["email"],
-                "profile_image_url": sender.get("profile_image_url"),
-                "phone": sender.get("phone"),
-                "birth_date": sender.get("birth_date"),
-                "followers": sender.get("followers", []),
-                "following": sender.get("following", []),
-                "private_account": sender.get("private_account", False)
-            }
-            del request["_id"]
+            # Remitente completo, con los mismos datos que el resto de listados de solicitudes
+            [request] = await enrich_follow_requests([request], loader)
+            sender = await loader.load(current_user_id)
+            request["sender"] = to_user_response(sender).model_dump(exclude={"is_following"}) if sender else None
             
         return request
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/{user_id}/follow-request/accept")
-async def accept_follow_request(user_id: str, request_id: str = Query(...)):
+async def accept_follow_request(
+    user_id: str,
+    background_tasks: BackgroundTasks,
+    request_id: str = Query(...),
+    loader: UserLoader = Depends(get_user_loader)
+):
     try:
-        # Update request status
-        result = await friend_requests_collection.update_one(
-            {"_id": ObjectId(request_id)},
-            {"$set": {"status": "accepted"}}
+        # Cambiar el estado y leer la solicitud en una sola operación, en paralelo con el perfil
+        request, user = await asyncio.gather(
+            friend_requests_collection.find_one_and_update(
+                {"_id": ObjectId(request_id), "status": "pending"},
+                {"$set": {"status": "accepted"}},
+                return_document=ReturnDocument.AFTER
+            ),
+            loader.load(user_id)
         )
         
-        if result.modified_count == 0:
+        if not request:
             raise HTTPException(status_code=404, detail="Request not found")
-        
-        # Get request details
-        request = await friend_requests_collection.find_one({"_id": ObjectId(request_id)})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
         
         # Add follower relationship
-        await users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$addToSet": {"followers": request["sender_id"]}}
-        )
+        receiver_id = request["receiver_id"]
+        if await add_follow(request["sender_id"], receiver_id):
+            search_index.adjust_followers(receiver_id, 1)
+            profile_cache.invalidate(receiver_id, request["sender_id"])
+            background_tasks.add_task(backfill_follow, request["sender_id"], receiver_id)
         
-        await users_collection.update_one(
-            {"_id": ObjectId(request["sender_id"])},
-            {"$addToSet": {"following": user_id}}
-        )
-        
-        # Get updated user data
-        updated_user = await users_collection.find_one({"_id": ObjectId(user_id)})
-        return UserResponse(**{
-            "id": str(updated_user["_id"]),
-            "username": updated_user["username"],
-            "email": updated_user["email"],
-            "profile_image_url": updated_user.get("profile_image_url"),
-            "phone": updated_user.get("phone"),
-            "birth_date": updated_user.get("birth_date"),
-            "followers": updated_user.get("followers", []),
-            "following": updated_user.get("following", []),
-            "private_account": updated_user.get("private_account", False)
-        })
+        return to_user_response(user)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/{user_id}/follow-request/reject")
-async def reject_follow_request(user_id: str, request_id: str = Query(...)):
+async def reject_follow_request(
+    user_id: str,
+    request_id: str = Query(...),
+    loader: UserLoader = Depends(get_user_loader)
+):
     try:
-        result = await friend_requests_collection.update_one(
-            {"_id": ObjectId(request_id)},
-            {"$set": {"status": "rejected"}}
+        request, user = await asyncio.gather(
+            friend_requests_collection.find_one_and_update(
+                {"_id": ObjectId(request_id), "status": "pending"},
+                {"$set": {"status": "rejected"}},
+                return_document=ReturnDocument.AFTER
+            ),
+            loader.load(user_id)
         )
         
-        if result.modified_count == 0:
+        if not request:
             raise HTTPException(status_code=404, detail="Request not found")
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
             
-        # Get updated user data
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
-        return UserResponse(**{
-            "id": str(user["_id"]),
-            "username": user["username"],
-            "email": user["email"],
-            "profile_image_url": user.get("profile_image_url"),
-            "phone": user.get("phone"),
-            "birth_date": user.get("birth_date"),
-            "followers": user.get("followers", []),
-            "following": user.get("following", []),
-            "private_account": user.get("private_account", False)
-        })
+        return to_user_response(user)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/users/{user_id}/follow-requests/received", response_model=List[FriendRequest])
-async def get_received_follow_requests(user_id: str):
+async def get_received_follow_requests(user_id: str, loader: UserLoader = Depends(get_user_loader)):
     try:
         requests = await friend_requests_collection.find({
             "receiver_id": user_id,
             "status": "pending"
         }).to_list(length=100)
         
-        response = []
-        for request in requests:
-            # Obtener información del remitente
-            sender = await users_collection.find_one({"_id": ObjectId(request["sender_id"])})
-            # Obtener información del receptor
-            receiver = await users_collection.find_one({"_id": ObjectId(request["receiver_id"])})
-            
-            request["id"] = str(request["_id"])
-            # Agregar información del remitente
-            request["senderUsername"] = sender["username"] if sender else "Unknown"
-            request["senderProfileImage"] = sender.get("profile_image_url") if sender else None
-            # Agregar información del receptor
-            request["receiverUsername"] = receiver["username"] if receiver else "Unknown"
-            request["receiverProfileImage"] = receiver.get("profile_image_url") if receiver else None
-            del request["_id"]
-            response.append(FriendRequest(**request))
-            
-        return response
+        # Remitentes y receptores en una sola consulta
+        requests = await enrich_follow_requests(requests, loader)
+        return [FriendRequest(**request) for request in requests]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/users/{user_id}/follow-requests/sent", response_model=List[FriendRequest])
-async def get_sent_follow_requests(user_id: str):
+async def get_sent_follow_requests(user_id: str, loader: UserLoader = Depends(get_user_loader)):
     try:
         requests = await friend_requests_collection.find({
             "sender_id": user_id,
             "status": "pending"
         }).to_list(length=100)
         
-        response = []
-        for request in requests:
-            # Obtener información del remitente
-            sender = await users_collection.find_one({"_id": ObjectId(request["sender_id"])})
-            # Obtener información del receptor
-            receiver = await users_collection.find_one({"_id": ObjectId(request["receiver_id"])})
-            
-            request["id"] = str(request["_id"])
-            # Agregar información del remitente
-            request["senderUsername"] = sender["username"] if sender else "Unknown"
-            request["senderProfileImage"] = sender.get("profile_image_url") if sender else None
-            # Agregar información del receptor
-            request["receiverUsername"] = receiver["username"] if receiver else "Unknown"
-            request["receiverProfileImage"] = receiver.get("profile_image_url") if receiver else None
-            del request["_id"]
-            response.append(FriendRequest(**request))
-            print(request)
-        return response
+        # Remitentes y receptores en una sola consulta
+        requests = await enrich_follow_requests(requests, loader)
+        return [FriendRequest(**request) for request in requests]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/upload")
 async def upload_image(image: UploadFile = File(...), user_id: str = Query(...)):
     try:
-        # Crear el directorio de uploads si no existe
-        UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "uploads")
-        if not os.path.exists(UPLOAD_DIR):
-            os.makedirs(UPLOAD_DIR)
-        
-        # Obtener la extensión del archivo original
-        file_extension = os.path.splitext(image.filename)[1]
-        
-        # Generar el nombre del archivo usando el ID del usuario
-        filename = f"{user_id}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        
-        # Si existe una imagen anterior con el mismo nombre, la eliminamos
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # El original se escribe por trozos en un fichero temporal oculto
+        original_path = temp_upload_path(image.filename)
+        _, digest = await save_upload(image, original_path)
         
-        # Guardar el archivo nuevo
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+        # Se guarda por contenido y sin referencias: la toma update_profile al asignarla al perfil
+        try:
+            variants = await blob_store.put(original_path, digest, refs=0)
+        except InvalidImageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            os.remove(original_path)
         
-        # Devolver la URL relativa del archivo
-        return {"imageUrl": f"/uploads/{filename}"}
+        # Devolver la URL relativa del archivo (tamaño completo) y la de cada variante
+        return {"imageUrl": variants["full"], "variants": variants}
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
         
\ No newline at end of file
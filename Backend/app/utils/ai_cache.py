@@ -0,0 +1,112 @@
+"""
+Cache of AI-generated comments keyed by image content.
+
+The key combines a SHA-256 of the decoded image bytes with a digest of the
+prompt and model, so changing either invalidates old entries. Each key holds
+up to AI_CACHE_VARIANTS different comments; once one exists, requests are
+answered from the cache and further variants are generated in the background.
+Entries live in an in-memory LRU (AI_CACHE_MAX_ENTRIES) and, with
+AI_CACHE_PERSIST enabled, in the ai_comments collection as well.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import random
+from collections import OrderedDict
+from datetime import datetime
+from dotenv import load_dotenv
+from ..database import ai_comments_collection
+
+load_dotenv()
+
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))
+AI_CACHE_VARIANTS = int(os.getenv("AI_CACHE_VARIANTS", "3"))
+AI_CACHE_PERSIST = os.getenv("AI_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+
+
+def image_digest(image: str | bytes) -> str:
+    """SHA-256 of the image content. Base64 payloads are decoded first."""
+    if isinstance(image, str):
+        try:
+            image = base64.b64decode(image, validate=True)
+        except (binascii.Error, ValueError):
+            image = image.encode()
+    return hashlib.sha256(image).hexdigest()
+
+
+def cache_key(image_hash: str, prompt: str, model: str) -> str:
+    version = hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()[:12]
+    return f"{image_hash}:{version}"
+
+
+class AICommentCache:
+    def __init__(self, max_entries: int = AI_CACHE_MAX_ENTRIES, variants: int = AI_CACHE_VARIANTS, persist: bool = AI_CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.variants = variants
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._filling = set()
+        self.stats = {"hits": 0, "misses": 0, "persisted_hits": 0, "variants_generated": 0}
+
+    async def _load(self, key: str) -> list:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.persist:
+            doc = await ai_comments_collection.find_one({"_id": key})
+            if doc and doc.get("variants"):
+                self.stats["persisted_hits"] += 1
+                self._store(key, doc["variants"])
+                return doc["variants"]
+        return []
+
+    def _store(self, key: str, variants: list):
+        self._entries[key] = variants
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def pick(self, key: str) -> str | None:
+        """Return one cached variant for the key, or None on a miss."""
+        variants = await self._load(key)
+        if not variants:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return random.choice(variants)
+
+    def wants_variant(self, key: str) -> bool:
+        """Whether another variant should be generated (and none is being generated already)."""
+        return key not in self._filling and len(self._entries.get(key, [])) < self.variants
+
+    def start_filling(self, key: str):
+        self._filling.add(key)
+
+    def stop_filling(self, key: str):
+        self._filling.discard(key)
+
+    async def add(self, key: str, comment: str):
+        variants = list(self._entries.get(key, []))
+        if not comment or comment in variants or len(variants) >= self.variants:
+            return
+        variants.append(comment)
+        self._store(key, variants)
+        self.stats["variants_generated"] += 1
+        if self.persist:
+            await ai_comments_collection.update_one(
+                {"_id": key},
+                {"$set": {"variants": variants, "updated_at": datetime.utcnow().isoformat()}},
+                upsert=True
+            )
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+        }
+
+
+comment_cache = AICommentCache()
@@ -0,0 +1,156 @@
+"""
+Background precomputation of AI comment suggestions.
+
+create_post enqueues a job per new image into a bounded in-process priority
+queue (AI_QUEUE_MAX). AI_WORKERS workers take jobs in priority order, wait
+until the model server has a free slot so live requests always go first, and
+store the result in the comment cache under both the image hash and the post
+id. Failed jobs are retried with exponential backoff (AI_RETRY_DELAY * 2^n
+seconds) up to AI_JOB_RETRIES times. With AI_QUEUE_FILE set, jobs still pending at shutdown are written to
+that file and re-enqueued on the next start.
+"""
+import asyncio
+import base64
+import itertools
+import json
+import os
+from dotenv import load_dotenv
+from .ollama import ollama_client, OllamaError, OLLAMA_MODEL, COMMENT_PROMPT
+from .ai_cache import comment_cache, image_digest, cache_key
+from .images import to_model_jpeg
+
+load_dotenv()
+
+AI_PRECOMPUTE = os.getenv("AI_PRECOMPUTE", "true").lower() in ("1", "true", "yes")
+AI_WORKERS = int(os.getenv("AI_WORKERS", "1"))
+AI_QUEUE_MAX = int(os.getenv("AI_QUEUE_MAX", "500"))
+AI_JOB_RETRIES = int(os.getenv("AI_JOB_RETRIES", "3"))
+AI_RETRY_DELAY = float(os.getenv("AI_RETRY_DELAY", "1"))
+AI_IDLE_POLL_SECONDS = float(os.getenv("AI_IDLE_POLL_SECONDS", "1"))
+AI_QUEUE_FILE = os.getenv("AI_QUEUE_FILE")
+
+PRIORITY_NEW_POST = 10
+
+
+def post_cache_key(post_id: str) -> str:
+    return cache_key(f"post:{post_id}", COMMENT_PROMPT, OLLAMA_MODEL)
+
+
+def _read_image_base64(path: str) -> tuple[str, bytes]:
+    with open(path, "rb") as image_file:
+        content = image_file.read()
+    # Las variantes se guardan en WebP; el modelo recibe JPEG
+    return base64.b64encode(to_model_jpeg(content)).decode(), content
+
+
+class AIJobQueue:
+    def __init__(
+        self,
+        workers: int = AI_WORKERS,
+        max_size: int = AI_QUEUE_MAX,
+        retries: int = AI_JOB_RETRIES,
+        queue_file: str | None = AI_QUEUE_FILE,
+        retry_delay: float = AI_RETRY_DELAY
+    ):
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue_file = queue_file
+        self._queue = asyncio.PriorityQueue(maxsize=max_size)
+        self._sequence = itertools.count()
+        self._tasks = []
+        self.stats = {"enqueued": 0, "completed": 0, "failed": 0, "dropped": 0}
+
+    def enqueue(self, job: dict, priority: int = PRIORITY_NEW_POST) -> bool:
+        """Add a job without waiting; returns False (and drops it) if the queue is full."""
+        job.setdefault("attempts", 0)
+        try:
+            self._queue.put_nowait((priority, next(self._sequence), job))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            print(f"Cola de IA llena, descartando trabajo para el post {job.get('post_id')}")
+            return False
+        self.stats["enqueued"] += 1
+        return True
+
+    async def _process(self, job: dict):
+        image, content = await asyncio.to_thread(_read_image_base64, job["image_path"])
+        comment = (await ollama_client.generate(COMMENT_PROMPT, [image])).strip('"')
+        await comment_cache.add(cache_key(image_digest(content), COMMENT_PROMPT, OLLAMA_MODEL), comment)
+        await comment_cache.add(post_cache_key(job["post_id"]), comment)
+
+    def _retry_later(self, priority: int, job: dict):
+        job["attempts"] += 1
+        if job["attempts"] > self.retries:
+            self.stats["failed"] += 1
+            print(f"Trabajo de IA para el post {job.get('post_id')} descartado tras {self.retries} reintentos")
+            return
+        delay = self.retry_delay * 2 ** job["attempts"]
+        asyncio.get_running_loop().call_later(delay, self.enqueue, job, priority)
+
+    async def _worker(self):
+        while True:
+            priority, _, job = await self._queue.get()
+            try:
+                # Solo precalculamos cuando el servidor del modelo está libre
+                while ollama_client.is_busy():
+                    await asyncio.sleep(AI_IDLE_POLL_SECONDS)
+                await self._process(job)
+                self.stats["completed"] += 1
+            except asyncio.CancelledError:
+                # Apagado: devolver el trabajo a la cola para guardarlo. Si enqueue ya
+                # ocupó el hueco se descarta; la cancelación debe propagarse igualmente
+                try:
+                    self._queue.put_nowait((priority, next(self._sequence), job))
+                except asyncio.QueueFull:
+                    self.stats["dropped"] += 1
+                    print(f"Cola de IA llena al apagar, descartando trabajo para el post {job.get('post_id')}")
+                raise
+            except FileNotFoundError:
+                # El post se borró antes de procesarlo
+                self.stats["failed"] += 1
+            except OllamaError as e:
+                print(f"Error precalculando comentario para el post {job.get('post_id')}: {str(e)}")
+                self._retry_later(priority, job)
+            except Exception as e:
+                print(f"Error inesperado en el trabajo de IA: {str(e)}")
+                self.stats["failed"] += 1
+            finally:
+                self._queue.task_done()
+
+    def _load_pending(self):
+        if not self.queue_file or not os.path.exists(self.queue_file):
+            return
+        with open(self.queue_file) as queue_file:
+            for line in queue_file:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.enqueue(entry["job"], entry["priority"])
+        os.remove(self.queue_file)
+
+    def _save_pending(self):
+        if not self.queue_file or self._queue.empty():
+            return
+        with open(self.queue_file, "w") as queue_file:
+            while not self._queue.empty():
+                priority, _, job = self._queue.get_nowait()
+                queue_file.write(json.dumps({"priority": priority, "job": job}) + "\n")
+
+    def start(self):
+        if self._tasks:
+            return
+        self._load_pending()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._save_pending()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "pending": self._queue.qsize()}
+
+
+ai_jobs = AIJobQueue()
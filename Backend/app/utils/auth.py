@@ -1,15 +1,62 @@
+from fastapi import HTTPException, Header, Depends
 from passlib.context import CryptContext
-from jose import jwt
+from jose import jwt, JWTError
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import asyncio
+import hashlib
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Coste de bcrypt: los hashes con otro coste se recalculan en el siguiente login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+# bcrypt libera el GIL, así que un pool de hilos acotado basta para sacarlo del event loop
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
+# Tokens ya verificados: cuántos se recuerdan y cuánto tiempo antes de volver a comprobar la firma
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+# Cuentas con acceso a métricas internas y exportaciones (ids de usuario separados por comas)
+ADMIN_USER_IDS = {user_id.strip() for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, pwd_context.hash, password)
+
+async def verify_password(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """
+    Verify a password off the event loop. Returns (valid, new_hash), where
+    new_hash is set when the stored hash uses an outdated cost and should be replaced.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, pwd_context.verify_and_update, password, hashed_password)
+
+def session_claims(user_id: str) -> dict:
+    """
+    Claims for a new access token: the user id, a session id and the issue time.
+    Profile data is deliberately left out; handlers read it from the profile cache.
+    """
+    return {
+        "user_id": user_id,
+        "sid": uuid.uuid4().hex,
+        "iat": int(time.time())
+    }
 
 def create_access_token(data: dict, no_expiry: bool = False):
     to_encode = data.copy()
@@ -29,20 +76,118 @@ def decode_token(token: str) -> dict:
                 detail="Token missing user_id"
             )
         
+        # Los tokens antiguos traen el perfil completo: se ignora, solo cuenta el user_id
         return {
             "user_id": payload.get("user_id"),
-            "username": payload.get("username", ""),
-            "email": payload.get("email", ""),
-            "profile_image_url": payload.get("profile_image_url"),
-            "phone": payload.get("phone"),
-            "birth_date": payload.get("birth_date"),
-            "followers": payload.get("followers", []),
-            "following": payload.get("following", []),
-            "private_account": payload.get("private_account", False)
+            "session_id": payload.get("sid"),
+            "issued_at": payload.get("iat"),
+            "expires_at": payload.get("exp")
         }
     except JWTError as e:
         print(f"JWT error: {str(e)}")
         raise HTTPException(
             status_code=401,
             detail="Invalid token"
-        )
\ No newline at end of file
+        )
+
+
+class TokenCache:
+    """
+    LRU of tokens whose signature has already been verified, keyed by the
+    SHA-256 digest of the token so raw tokens are never kept in memory.
+    An entry lives for TOKEN_CACHE_TTL seconds, never past the token's own
+    exp claim, and at most TOKEN_CACHE_MAX_ENTRIES entries are kept.
+    Invalid tokens are not cached.
+    """
+
+    def __init__(self, ttl: float = TOKEN_CACHE_TTL, max_entries: int = TOKEN_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "rejected": 0}
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        digest = self._digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if entry[0] <= time.time():
+            del self._entries[digest]
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def put(self, token: str, claims: dict):
+        deadline = time.time() + self.ttl
+        if claims.get("expires_at") is not None:
+            deadline = min(deadline, claims["expires_at"])
+        digest = self._digest(token)
+        self._entries[digest] = (deadline, claims)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0
+        }
+
+
+token_cache = TokenCache()
+
+def authenticate(token: str) -> dict:
+    """Return the claims of a valid, unexpired token, verifying its signature only on a cache miss."""
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+
+    try:
+        claims = decode_token(token)
+    except HTTPException:
+        token_cache.stats["rejected"] += 1
+        raise
+    if claims["expires_at"] is not None and claims["expires_at"] <= time.time():
+        token_cache.stats["rejected"] += 1
+        raise HTTPException(status_code=401, detail="Token expired")
+
+    token_cache.put(token, claims)
+    return claims
+
+async def get_current_user(authorization: str | None = Header(default=None, alias="Authorization")) -> dict:
+    """FastAPI dependency shared by the authenticated routes: `user_data: dict = Depends(get_current_user)`."""
+    if not authorization:
+        raise HTTPException(
+            status_code=401,
+            detail="Authorization header is required. Use format: Bearer <token>"
+        )
+
+    if authorization.startswith("Bearer "):
+        token = authorization.split(" ")[1]
+    else:
+        token = authorization
+
+    return authenticate(token)
+
+def require_admin(user_data: dict) -> dict:
+    if user_data["user_id"] not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user_data
+
+async def get_admin_user(user_data: dict = Depends(get_current_user)) -> dict:
+    """Like get_current_user, but only for the accounts listed in ADMIN_USER_IDS (403 otherwise)."""
+    return require_admin(user_data)
@@ -0,0 +1,141 @@
+"""
+Content-addressed storage for uploaded images.
+
+An upload is identified by the SHA-256 of its bytes. Its variants live under
+uploads/blobs/<2 hex>/<2 hex>/<digest>_<variant>.<ext>, so the URL of a
+given content never changes and uploading the same image twice, by anyone,
+stores it once and skips transcoding.
+
+The blobs collection keeps one document per digest:
+{_id: digest, refs, variants: {name: url}, size, created_at}. refs counts
+the documents that point at the blob: posts (image_blob) and users
+(profile_image_blob). create_post takes its reference when storing the
+image. /upload stores profile pictures without one, and update_profile
+takes it when the picture is actually set. release() only drops a
+reference: blobs are deleted by the garbage collector (cleanup.py), which
+checks that no document points at them first.
+"""
+import asyncio
+import glob
+import os
+import re
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from ..database import blobs_collection
+from .uploads import UPLOAD_DIR, upload_url
+from .images import image_processor
+from .media import media_cache
+
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+BLOB_URL = re.compile(r"^/uploads/blobs/[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})_[a-z]+\.[a-z]+$")
+
+
+def blob_digest(url: str | None) -> str | None:
+    """Digest of a blob variant URL; None for anything else (legacy uploads, external URLs)."""
+    match = BLOB_URL.match(url or "")
+    return match["digest"] if match else None
+
+
+def _remove_files(pattern: str) -> int:
+    freed = 0
+    for path in glob.glob(pattern):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            continue
+    return freed
+
+
+class BlobStore:
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = root
+        self._locks = {}
+        self.stats = {"stored": 0, "deduplicated": 0, "deleted": 0, "bytes_freed": 0}
+
+    def stem_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    async def _locked(self, digest: str, operation):
+        # Guardar y borrar el mismo blob a la vez podría borrar ficheros recién escritos;
+        # las subidas simultáneas de la misma imagen además solo se transcodifican una vez
+        entry = self._locks.setdefault(digest, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await operation()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[digest]
+
+    async def put(self, source_path: str, digest: str, refs: int = 1) -> dict:
+        """
+        Store the image at source_path under digest, transcoding it only if
+        the blob doesn't exist yet, and add refs references.
+        Returns {variant name: url}. Raises InvalidImageError for non-images.
+        """
+        async def store():
+            blob = await blobs_collection.find_one_and_update(
+                {"_id": digest},
+                {"$inc": {"refs": refs}},
+                return_document=ReturnDocument.AFTER
+            )
+            if blob:
+                self.stats["deduplicated"] += 1
+                return blob["variants"]
+
+            stem = self.stem_path(digest)
+            await asyncio.to_thread(os.makedirs, os.path.dirname(stem), exist_ok=True)
+            paths = await image_processor.process(source_path, stem)
+            variants = {name: upload_url(path) for name, path in paths.items()}
+            size = sum(await asyncio.gather(*(asyncio.to_thread(os.path.getsize, path) for path in paths.values())))
+            try:
+                await blobs_collection.update_one(
+                    {"_id": digest},
+                    {
+                        "$inc": {"refs": refs},
+                        "$setOnInsert": {"variants": variants, "size": size, "created_at": datetime.utcnow().isoformat()}
+                    },
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                # Otro proceso guardó la misma imagen a la vez
+                await blobs_collection.update_one({"_id": digest}, {"$inc": {"refs": refs}})
+            self.stats["stored"] += 1
+            return variants
+
+        return await self._locked(digest, store)
+
+    async def acquire(self, digest: str) -> bool:
+        """Add a reference; False if the blob doesn't exist."""
+        result = await blobs_collection.update_one({"_id": digest}, {"$inc": {"refs": 1}})
+        return result.matched_count == 1
+
+    async def release(self, digest: str | None):
+        """Drop a reference. Unused blobs are deleted later by the garbage collector."""
+        if not digest:
+            return
+        await blobs_collection.update_one({"_id": digest}, {"$inc": {"refs": -1}})
+
+    async def delete(self, digest: str) -> int:
+        """Delete an unreferenced blob and its files; returns the bytes freed."""
+        async def remove():
+            result = await blobs_collection.delete_one({"_id": digest, "refs": {"$lte": 0}})
+            if not result.deleted_count:
+                return 0
+            freed = await asyncio.to_thread(_remove_files, f"{self.stem_path(digest)}_*")
+            media_cache.evict_prefix(f"{self.stem_path(digest)}_")
+            self.stats["deleted"] += 1
+            self.stats["bytes_freed"] += freed
+            return freed
+
+        return await self._locked(digest, remove)
+
+    def get_stats(self) -> dict:
+        return dict(self.stats)
+
+
+blob_store = BlobStore()
@@ -0,0 +1,364 @@
+"""
+Background garbage collection for deleted posts and replaced images.
+
+Deleting a post or changing a profile picture only records a job in the
+gc_jobs collection; the collector does the cleanup off the request path:
+
+    post   comments, likes, saved_posts and timeline rows of the post (one
+           delete_many each), then its image
+    image  a replaced profile picture
+
+Blob store images are deleted once their refs drop to zero and no post or
+user points at them any more. refs is only trusted to say "maybe unused":
+references are counted before deleting, so a job that runs twice can never
+delete an image that is still in use. Legacy uploads (single files directly
+under uploads/) are deleted when no document has that URL.
+
+Jobs survive restarts: a worker leases a job for GC_JOB_LEASE_SECONDS and,
+if the process dies, the job is taken again when the lease runs out. Failed
+jobs are retried with backoff up to GC_JOB_RETRIES times.
+
+Every GC_RECONCILE_SECONDS the reconciler catches what the jobs missed
+(posts deleted before this existed, crashes between steps): unreferenced
+blobs, files in uploads/ that no document references, abandoned temporary
+upload files and rows of posts that no longer exist. Anything younger than
+GC_GRACE_SECONDS is left alone, since an upload may not be attached to its
+post or profile yet. Reclaimed bytes are reported in get_stats().
+
+Usage:
+    python -m app.utils.cleanup     # run the reconciler once
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+from ..database import (
+    posts_collection, users_collection, comments_collection, likes_collection,
+    saved_posts_collection, blobs_collection, gc_jobs_collection
+)
+from .uploads import UPLOAD_DIR, upload_url
+from .blobs import blob_store, blob_digest, BLOB_DIR
+from .media import media_cache, resolve
+from .timeline import remove_post
+
+load_dotenv()
+
+GC_POLL_SECONDS = float(os.getenv("GC_POLL_SECONDS", "5"))
+GC_JOB_LEASE_SECONDS = float(os.getenv("GC_JOB_LEASE_SECONDS", "300"))
+GC_JOB_RETRIES = int(os.getenv("GC_JOB_RETRIES", "5"))
+GC_RECONCILE_SECONDS = float(os.getenv("GC_RECONCILE_SECONDS", "3600"))
+GC_GRACE_SECONDS = float(os.getenv("GC_GRACE_SECONDS", "3600"))
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE", "500"))
+
+POST_ROW_COLLECTIONS = (comments_collection, likes_collection, saved_posts_collection)
+
+
+def _remove_file(path: str) -> int:
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def _scan_uploads(root: str, cutoff: float) -> list:
+    """(path, size) of every file under root last modified before cutoff."""
+    files = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                result = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if result.st_mtime < cutoff:
+                files.append((path, result.st_size))
+    return files
+
+
+def _batches(items: list, size: int = GC_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class GarbageCollector:
+    def __init__(
+        self,
+        poll_seconds: float = GC_POLL_SECONDS,
+        reconcile_seconds: float = GC_RECONCILE_SECONDS,
+        grace_seconds: float = GC_GRACE_SECONDS,
+        retries: int = GC_JOB_RETRIES
+    ):
+        self.poll_seconds = poll_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.grace_seconds = grace_seconds
+        self.retries = retries
+        self._tasks = []
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self.stats = {
+            "jobs_completed": 0, "jobs_failed": 0, "rows_deleted": 0, "blobs_deleted": 0,
+            "files_deleted": 0, "bytes_reclaimed": 0, "reconciles": 0, "last_reconcile": None
+        }
+
+    async def enqueue_post(self, post: dict):
+        """Record the cleanup of a post. Call it before deleting the post and wake() after."""
+        await self._enqueue({
+            "kind": "post",
+            "post_id": str(post["_id"]),
+            "image_blob": post.get("image_blob"),
+            "image_url": post.get("image_url")
+        })
+
+    async def enqueue_image(self, image_url: str | None, image_blob: str | None):
+        """Record the cleanup of an image nothing points at any more (a replaced profile picture)."""
+        if not image_url and not image_blob:
+            return
+        await self._enqueue({"kind": "image", "image_blob": image_blob, "image_url": image_url})
+        self.wake()
+
+    async def _enqueue(self, job: dict):
+        now = datetime.utcnow()
+        await gc_jobs_collection.insert_one({**job, "attempts": 0, "next_attempt_at": now, "created_at": now})
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def _run_next_job(self) -> bool:
+        """Lease and run one due job; False if there was none."""
+        now = datetime.utcnow()
+        job = await gc_jobs_collection.find_one_and_update(
+            {"next_attempt_at": {"$lte": now}},
+            {"$set": {"next_attempt_at": now + timedelta(seconds=GC_JOB_LEASE_SECONDS)}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            return False
+        try:
+            if job["kind"] == "post":
+                await self._collect_post(job)
+            else:
+                await self._collect_image(job)
+        except Exception as e:
+            attempts = job.get("attempts", 0) + 1
+            if attempts > self.retries:
+                print(f"GC: se descarta el trabajo {job['_id']} ({job['kind']}) tras {attempts} intentos: {str(e)}")
+                self.stats["jobs_failed"] += 1
+                await gc_jobs_collection.delete_one({"_id": job["_id"]})
+            else:
+                retry_at = datetime.utcnow() + timedelta(seconds=min(self.poll_seconds * 2 ** attempts, GC_JOB_LEASE_SECONDS))
+                await gc_jobs_collection.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {"attempts": attempts, "next_attempt_at": retry_at, "error": str(e)}}
+                )
+            return True
+
+        await gc_jobs_collection.delete_one({"_id": job["_id"]})
+        self.stats["jobs_completed"] += 1
+        return True
+
+    async def _collect_post(self, job: dict):
+        post_id = job["post_id"]
+        # El trabajo se registra antes de borrar el post: si sigue ahí, el borrado aún no ha llegado (o falló)
+        if await posts_collection.find_one({"_id": ObjectId(post_id)}, {"_id": 1}):
+            raise RuntimeError(f"Post {post_id} still exists")
+
+        results = await asyncio.gather(*(
+            collection.delete_many({"post_id": post_id}) for collection in POST_ROW_COLLECTIONS
+        ))
+        self.stats["rows_deleted"] += sum(result.deleted_count for result in results)
+        await remove_post(post_id)
+        await self._collect_image(job)
+
+    async def _collect_image(self, job: dict):
+        if job.get("image_blob"):
+            await blob_store.release(job["image_blob"])
+            await self.collect_blob(job["image_blob"])
+        elif job.get("image_url"):
+            await self.collect_legacy_file(job["image_url"])
+
+    async def _blob_references(self, digest: str) -> int:
+        posts, users = await asyncio.gather(
+            posts_collection.count_documents({"image_blob": digest}),
+            users_collection.count_documents({"profile_image_blob": digest})
+        )
+        return posts + users
+
+    async def collect_blob(self, digest: str) -> bool:
+        """Delete the blob if refs says it's unused and no document references it."""
+        blob = await blobs_collection.find_one({"_id": digest}, {"refs": 1})
+        if not blob or blob["refs"] > 0:
+            return False
+        references = await self._blob_references(digest)
+        if references:
+            # Una referencia liberada dos veces: se corrige el contador en lugar de borrar
+            print(f"GC: el blob {digest} tiene {references} referencias con refs={blob['refs']}, se corrige")
+            await blobs_collection.update_one({"_id": digest, "refs": blob["refs"]}, {"$set": {"refs": references}})
+            return False
+        freed = await blob_store.delete(digest)
+        if freed:
+            self.stats["blobs_deleted"] += 1
+            self.stats["bytes_reclaimed"] += freed
+        return bool(freed)
+
+    async def _legacy_file_referenced(self, image_url: str) -> bool:
+        post = await posts_collection.find_one({"image_url": image_url}, {"_id": 1})
+        return bool(post or await users_collection.find_one({"profile_image_url": image_url}, {"_id": 1}))
+
+    async def collect_legacy_file(self, image_url: str) -> bool:
+        """Delete a pre-blob-store upload if no post or user uses that URL any more."""
+        if not image_url.startswith("/uploads/") or blob_digest(image_url):
+            return False
+        path = resolve(image_url.removeprefix("/uploads/"))
+        if path is None or await self._legacy_file_referenced(image_url):
+            return False
+        freed = await asyncio.to_thread(_remove_file, path)
+        media_cache.evict(path)
+        if freed:
+            self.stats["files_deleted"] += 1
+            self.stats["bytes_reclaimed"] += freed
+        return bool(freed)
+
+    async def reconcile(self) -> dict:
+        """Delete whatever the jobs missed; returns what this run reclaimed."""
+        started = time.monotonic()
+        before = dict(self.stats)
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace_seconds)
+
+        async for blob in blobs_collection.find({"refs": {"$lte": 0}, "created_at": {"$lt": cutoff.isoformat()}}, {"_id": 1}):
+            await self.collect_blob(blob["_id"])
+        await self._reconcile_files(time.time() - self.grace_seconds)
+        await self._reconcile_rows()
+
+        report = {
+            field: self.stats[field] - before[field]
+            for field in ("rows_deleted", "blobs_deleted", "files_deleted", "bytes_reclaimed")
+        }
+        report["seconds"] = round(time.monotonic() - started, 3)
+        report["finished_at"] = datetime.utcnow().isoformat()
+        self.stats["reconciles"] += 1
+        self.stats["last_reconcile"] = report
+        print(
+            f"GC: reconciliación terminada, {report['bytes_reclaimed']} bytes recuperados "
+            f"({report['blobs_deleted']} blobs, {report['files_deleted']} ficheros, {report['rows_deleted']} filas)"
+        )
+        return report
+
+    async def _reconcile_files(self, cutoff: float):
+        files = await asyncio.to_thread(_scan_uploads, UPLOAD_DIR, cutoff)
+        blob_prefix = BLOB_DIR + os.sep
+        orphans = []
+        blob_files = {}
+        legacy_files = []
+        for path, size in files:
+            name = os.path.basename(path)
+            if name.startswith(".") or name.endswith(".part"):
+                # Subidas o variantes que no llegaron a terminar
+                orphans.append(path)
+            elif path.startswith(blob_prefix):
+                blob_files[upload_url(path)] = path
+            else:
+                legacy_files.append(path)
+
+        # Ficheros de blobs que no son variantes de ningún blob registrado
+        for urls in _batches(list(blob_files)):
+            digests = list({blob_digest(url) for url in urls} - {None})
+            known = set()
+            async for blob in blobs_collection.find({"_id": {"$in": digests}}, {"variants": 1}):
+                known.update(blob.get("variants", {}).values())
+            orphans.extend(blob_files[url] for url in urls if url not in known)
+
+        if legacy_files:
+            # Solo los documentos sin blob pueden apuntar a ficheros antiguos
+            referenced = set(await posts_collection.distinct("image_url", {"image_blob": None}))
+            referenced.update(await users_collection.distinct("profile_image_url", {"profile_image_blob": None}))
+            orphans.extend(path for path in legacy_files if upload_url(path) not in referenced)
+
+        for path in orphans:
+            freed = await asyncio.to_thread(_remove_file, path)
+            media_cache.evict(path)
+            self.stats["files_deleted"] += 1
+            self.stats["bytes_reclaimed"] += freed
+
+    async def _reconcile_rows(self):
+        """Comments, likes and saved entries of posts deleted without a job."""
+        for collection in POST_ROW_COLLECTIONS:
+            post_ids = await collection.distinct("post_id")
+            for batch in _batches(post_ids):
+                object_ids = [ObjectId(post_id) for post_id in batch if ObjectId.is_valid(post_id)]
+                existing = {
+                    str(post["_id"])
+                    async for post in posts_collection.find({"_id": {"$in": object_ids}}, {"_id": 1})
+                }
+                missing = [post_id for post_id in batch if post_id not in existing]
+                if missing:
+                    result = await collection.delete_many({"post_id": {"$in": missing}})
+                    self.stats["rows_deleted"] += result.deleted_count
+
+    async def _run_jobs(self):
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                while not self._stopping.is_set() and await self._run_next_job():
+                    pass
+            except Exception as e:
+                print(f"GC: error procesando trabajos: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_reconciler(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.reconcile_seconds)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"GC: error en la reconciliación: {str(e)}")
+
+    def start(self):
+        if self._tasks:
+            return
+        self._stopping.clear()
+        self._tasks.append(asyncio.create_task(self._run_jobs()))
+        if self.reconcile_seconds > 0:
+            self._tasks.append(asyncio.create_task(self._run_reconciler()))
+
+    async def stop(self):
+        """Finish the current job and stop; pending jobs stay in gc_jobs for the next start."""
+        if not self._tasks:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        tasks, self._tasks = self._tasks, []
+        # Una reconciliación a medias se puede cortar: la siguiente retoma lo que quede
+        for task in tasks[1:]:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        return dict(self.stats)
+
+
+garbage_collector = GarbageCollector()
+
+
+def main(argv):
+    report = asyncio.run(garbage_collector.reconcile())
+    for field, value in report.items():
+        print(f"{field:>16}  {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,107 @@
+"""
+Write-behind counter aggregation.
+
+Hot documents (a viral post receiving many likes and comments) turn every
+interaction into an $inc on the same document. CounterBuffer coalesces the
+deltas per document in memory and applies them with one bulk_write every
+COUNTER_FLUSH_MS milliseconds and on shutdown. overlay() adds pending deltas
+to documents read from Mongo so responses still reflect the user's own writes.
+The same applies to follower counts when an account receives a follow storm.
+
+Deltas live in this process only: other workers see them after the next flush.
+"""
+import asyncio
+import os
+from collections import defaultdict
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+from ..database import posts_collection, users_collection
+
+load_dotenv()
+
+COUNTER_FLUSH_MS = int(os.getenv("COUNTER_FLUSH_MS", "500"))
+
+
+class CounterBuffer:
+    def __init__(self, collection, flush_interval_ms: int = COUNTER_FLUSH_MS):
+        self.collection = collection
+        self.flush_interval = flush_interval_ms / 1000
+        self.pending = defaultdict(lambda: defaultdict(int))
+        # Deltas taken by an in-progress flush, still overlaid until written
+        self.flushing = {}
+        self._task = None
+        self._stopping = asyncio.Event()
+
+    def add(self, doc_id: str, field: str, delta: int):
+        ObjectId(doc_id)  # Reject malformed ids now rather than at flush time
+        self.pending[doc_id][field] += delta
+
+    def pending_for(self, doc_id: str) -> dict:
+        deltas = defaultdict(int)
+        for source in (self.flushing, self.pending):
+            for field, delta in source.get(doc_id, {}).items():
+                deltas[field] += delta
+        return deltas
+
+    def overlay(self, doc: dict) -> dict:
+        """Return a copy of `doc` with pending deltas added to its counters."""
+        deltas = self.pending_for(str(doc["_id"]))
+        if not deltas:
+            return doc
+        doc = dict(doc)
+        for field, delta in deltas.items():
+            doc[field] = doc.get(field, 0) + delta
+        return doc
+
+    async def flush(self):
+        if not self.pending or self.flushing:
+            return
+        self.flushing, self.pending = self.pending, defaultdict(lambda: defaultdict(int))
+        batch = [(doc_id, dict(fields)) for doc_id, fields in self.flushing.items() if any(fields.values())]
+        try:
+            if batch:
+                await self.collection.bulk_write(
+                    [UpdateOne({"_id": ObjectId(doc_id)}, {"$inc": fields}) for doc_id, fields in batch],
+                    ordered=False
+                )
+        except BulkWriteError as e:
+            print(f"Error flushing counters for {self.collection.name}: {e.details.get('writeErrors')}")
+            self._requeue([batch[error["index"]] for error in e.details.get("writeErrors", [])])
+        except Exception as e:
+            print(f"Error flushing counters for {self.collection.name}: {e}")
+            self._requeue(batch)
+        finally:
+            self.flushing = {}
+
+    def _requeue(self, batch: list):
+        """Put failed deltas back so the next flush retries them."""
+        for doc_id, fields in batch:
+            for field, delta in fields.items():
+                self.pending[doc_id][field] += delta
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still pending."""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+post_counters = CounterBuffer(posts_collection)
+user_counters = CounterBuffer(users_collection)
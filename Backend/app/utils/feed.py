@@ -0,0 +1,137 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+from ..database import users_collection, likes_collection, saved_posts_collection
+from .counters import post_counters
+
+
+def to_object_ids(ids):
+    """Convert string ids to ObjectIds, silently dropping malformed ones."""
+    object_ids = []
+    for id_ in ids:
+        try:
+            object_ids.append(ObjectId(id_))
+        except (InvalidId, TypeError):
+            continue
+    return object_ids
+
+
+async def fetch_authors(author_ids, projection=None) -> dict:
+    """Fetch every referenced author with a single $in query, keyed by id string."""
+    object_ids = to_object_ids(set(author_ids))
+    if not object_ids:
+        return {}
+    authors = await users_collection.find(
+        {"_id": {"$in": object_ids}},
+        projection
+    ).to_list(len(object_ids))
+    return {str(author["_id"]): author for author in authors}
+
+
+async def fetch_viewer_flags(user_id: str, post_ids) -> tuple[set, set]:
+    """Return the subsets of post_ids the user has liked and saved (one query each)."""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return set(), set()
+    query = {"user_id": user_id, "post_id": {"$in": post_ids}}
+    likes = await likes_collection.find(query, {"post_id": 1}).to_list(len(post_ids))
+    saved = await saved_posts_collection.find(query, {"post_id": 1}).to_list(len(post_ids))
+    return {like["post_id"] for like in likes}, {save["post_id"] for save in saved}
+
+
+def parse_cursor(cursor: str) -> tuple[str, ObjectId]:
+    """Parse a `<timestamp>,<post_id>` keyset cursor. Raises ValueError if malformed."""
+    timestamp, _, post_id = cursor.rpartition(",")
+    if not timestamp:
+        raise ValueError("Cursor must have the form <timestamp>,<post_id>")
+    try:
+        return timestamp, ObjectId(post_id)
+    except (InvalidId, TypeError):
+        raise ValueError("Cursor contains an invalid post id")
+
+
+def encode_cursor(post: dict) -> str:
+    return f"{post.get('timestamp', '')},{post['_id']}"
+
+
+def before_cursor_filter(cursor: str, id_field: str = "_id") -> dict:
+    """Match posts strictly older than the cursor in (timestamp, id_field) order."""
+    timestamp, post_id = parse_cursor(cursor)
+    return {"$or": [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, id_field: {"$lt": post_id}}
+    ]}
+
+
+def visibility_filter(user_id: str, following: list) -> dict:
+    """
+    Posts the user may see: public authors, followed authors and their own.
+    Relies on the author_private flag denormalized onto each post. Posts
+    without the flag (created before it existed) only reach followers until
+    `python -m app.utils.migrations author_private` has run.
+    """
+    return {"$or": [
+        {"author_private": False},
+        {"author_id": {"$in": list(following) + [user_id]}}
+    ]}
+
+
+FEED_SORT = [("timestamp", -1), ("_id", -1)]
+
+
+def author_image_url(author: dict | None) -> str | None:
+    """Smallest available picture of the author, for the avatar next to a post."""
+    if not author:
+        return None
+    variants = author.get("profile_image_variants") or {}
+    return variants.get("thumb") or author.get("profile_image_url")
+
+
+def serialize_post(post: dict, is_liked: bool, is_saved: bool, author: dict | None = None) -> dict:
+    return {
+        "id": str(post["_id"]),
+        "author_id": post.get("author_id", ""),
+        "author_username": post.get("author_username", ""),
+        "author_profile_image_url": author_image_url(author),
+        "image_url": post.get("image_url", ""),
+        "image_variants": post.get("image_variants"),
+        "caption": post.get("caption", ""),
+        "timestamp": post.get("timestamp", ""),
+        "likes_count": post.get("likes_count", 0),
+        "comments_count": post.get("comments_count", 0),
+        "is_liked": is_liked,
+        "is_saved": is_saved
+    }
+
+
+async def assemble_feed(posts: list, user_id: str, users) -> list:
+    """
+    Build the feed response for `posts` in three round-trips: authors (one
+    batch through the request's UserLoader), likes and saves are each fetched
+    with one $in query and joined in memory.
+
+    Visibility is already resolved by the query that read `posts`
+    (visibility_filter, or the user's own timeline), so every post is kept
+    except those whose author no longer exists. Callers take the page cursor
+    from the posts they read, not from this result, so a skipped post never
+    ends pagination early.
+    """
+    authors = await users.load_many(post.get("author_id") for post in posts)
+
+    visible_posts = []
+    for post in posts:
+        if post.get("author_id") not in authors:
+            print(f"Error processing post {post.get('_id', 'unknown')}: author not found")
+            continue
+        visible_posts.append(post)
+
+    liked, saved = await fetch_viewer_flags(user_id, [str(post["_id"]) for post in visible_posts])
+
+    return [
+        serialize_post(
+            post_counters.overlay(post),
+            str(post["_id"]) in liked,
+            str(post["_id"]) in saved,
+            authors.get(post["author_id"])
+        )
+        for post in visible_posts
+    ]
@@ -0,0 +1,122 @@
+"""
+Follow relationships.
+
+Each follow is one document in the follows collection:
+{follower_id, followee_id, created_at}, unique per pair. User documents only
+keep followers_count and following_count, which change exactly when an edge
+is actually inserted or deleted. The counters go through the write-behind
+user_counters buffer, so a follow or unfollow costs one write on the request
+path however many accounts it touches.
+"""
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from ..database import users_collection, follows_collection, friend_requests_collection
+from .feed import to_object_ids
+from .counters import user_counters
+
+FOLLOW_PAGE_SIZE = 50
+FOLLOWER_BATCH_SIZE = 1000
+
+
+async def add_follow(follower_id: str, followee_id: str) -> bool:
+    """Create the edge and bump both counters. False if it already existed."""
+    ObjectId(follower_id), ObjectId(followee_id)  # Ids inválidos fallan antes de escribir nada
+    try:
+        await follows_collection.insert_one({
+            "follower_id": follower_id,
+            "followee_id": followee_id,
+            "created_at": datetime.utcnow().isoformat()
+        })
+    except DuplicateKeyError:
+        return False
+    user_counters.add(followee_id, "followers_count", 1)
+    user_counters.add(follower_id, "following_count", 1)
+    return True
+
+
+async def delete_follow(follower_id: str, followee_id: str) -> bool:
+    """Remove the edge and decrement both counters. False if there was no edge."""
+    result = await follows_collection.delete_one({"follower_id": follower_id, "followee_id": followee_id})
+    if not result.deleted_count:
+        return False
+    user_counters.add(followee_id, "followers_count", -1)
+    user_counters.add(follower_id, "following_count", -1)
+    return True
+
+
+async def send_follow_request(sender_id: str, receiver_id: str) -> bool:
+    """Create a pending follow request in one upsert. False if one was already pending."""
+    result = await friend_requests_collection.update_one(
+        {"sender_id": sender_id, "receiver_id": receiver_id, "status": "pending"},
+        {"$setOnInsert": {"created_at": datetime.utcnow().isoformat()}},
+        upsert=True
+    )
+    return result.upserted_id is not None
+
+
+async def is_following(follower_id: str, followee_id: str) -> bool:
+    return await follows_collection.find_one(
+        {"follower_id": follower_id, "followee_id": followee_id},
+        {"_id": 1}
+    ) is not None
+
+
+async def following_ids(user_id: str) -> list:
+    edges = await follows_collection.find({"follower_id": user_id}, {"followee_id": 1}).to_list(None)
+    return [edge["followee_id"] for edge in edges]
+
+
+async def iter_follower_ids(user_id: str, batch_size: int = FOLLOWER_BATCH_SIZE):
+    """Yield the user's follower ids in lists of up to batch_size, without loading them all."""
+    batch = []
+    async for edge in follows_collection.find({"followee_id": user_id}, {"follower_id": 1}).batch_size(batch_size):
+        batch.append(edge["follower_id"])
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def list_follows(user_id: str, direction: str, after: str | None, limit: int, projection=None) -> tuple[list, str | None]:
+    """
+    One page of a user's followers (direction="followers") or followed
+    accounts (direction="following"), newest edge first.
+    Returns (user documents, cursor for the next page or None).
+    Raises ValueError for a malformed cursor.
+    """
+    owner_field, other_field = ("followee_id", "follower_id") if direction == "followers" else ("follower_id", "followee_id")
+    query = {owner_field: user_id}
+    if after:
+        if not ObjectId.is_valid(after):
+            raise ValueError("Invalid cursor")
+        query["_id"] = {"$lt": ObjectId(after)}
+
+    edges = await follows_collection.find(query, {other_field: 1}).sort("_id", -1).to_list(limit)
+    next_cursor = str(edges[-1]["_id"]) if len(edges) == limit else None
+
+    ids = [edge[other_field] for edge in edges]
+    users = await users_collection.find({"_id": {"$in": to_object_ids(ids)}}, projection).to_list(len(ids))
+    by_id = {str(user["_id"]): user for user in users}
+    return [by_id[user_id] for user_id in ids if user_id in by_id], next_cursor
+
+
+async def enrich_follow_requests(requests: list, users) -> list:
+    """
+    Add id and the sender/receiver username and picture to each follow
+    request. Every referenced user is fetched in one batch through the
+    request's UserLoader.
+    """
+    users = await users.load_many(
+        [request["sender_id"] for request in requests] + [request["receiver_id"] for request in requests]
+    )
+    for request in requests:
+        sender = users.get(request["sender_id"])
+        receiver = users.get(request["receiver_id"])
+        request["id"] = str(request.pop("_id"))
+        request["senderUsername"] = sender["username"] if sender else "Unknown"
+        request["senderProfileImage"] = sender.get("profile_image_url") if sender else None
+        request["receiverUsername"] = receiver["username"] if receiver else "Unknown"
+        request["receiverProfileImage"] = receiver.get("profile_image_url") if receiver else None
+    return requests
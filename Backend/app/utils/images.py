@@ -0,0 +1,151 @@
+"""
+Image variants for uploaded pictures.
+
+Every uploaded image is decoded once and re-encoded (IMAGE_FORMAT, WebP by
+default) at up to three widths:
+
+    thumb  IMAGE_THUMB_WIDTH  (320)   grids, avatars and notifications
+    feed   IMAGE_FEED_WIDTH   (1080)  the post card in the feed
+    full   IMAGE_FULL_WIDTH   (2048)  detail view; image_url points here
+
+Images are never upscaled. EXIF orientation is applied to the pixels and all
+other metadata (location, camera, thumbnails) is dropped; only the ICC
+profile is kept so colours don't shift. Decoding and encoding are CPU-bound,
+so they run in a process pool of IMAGE_WORKERS processes instead of on the
+event loop. The routes keep only the variants, not the original upload.
+"""
+import asyncio
+import io
+import os
+import re
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+load_dotenv()
+
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_VARIANTS = {
+    "thumb": int(os.getenv("IMAGE_THUMB_WIDTH", "320")),
+    "feed": int(os.getenv("IMAGE_FEED_WIDTH", "1080")),
+    "full": int(os.getenv("IMAGE_FULL_WIDTH", "2048"))
+}
+# Imágenes con más píxeles se rechazan antes de decodificarlas (bombas de descompresión)
+Image.MAX_IMAGE_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(50_000_000)))
+
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+
+class InvalidImageError(Exception):
+    pass
+
+
+FULL_VARIANT_URL = re.compile(r"^(?P<stem>.+)_full\.(?P<ext>webp|jpg)$")
+
+
+def variant_path(stem_path: str, name: str) -> str:
+    return f"{stem_path}_{name}.{EXTENSIONS[IMAGE_FORMAT]}"
+
+
+def variant_urls(image_url: str | None) -> dict | None:
+    """The variant URLs that go with a full-size variant URL; None for legacy single-file images."""
+    match = FULL_VARIANT_URL.match(image_url or "")
+    if not match:
+        return None
+    return {name: f"{match['stem']}_{name}.{match['ext']}" for name in IMAGE_VARIANTS}
+
+
+def _encode(image: Image.Image, path: str, icc_profile: bytes | None):
+    options = {"quality": IMAGE_QUALITY}
+    if icc_profile:
+        options["icc_profile"] = icc_profile
+    if IMAGE_FORMAT == "jpeg":
+        options.update(optimize=True, progressive=True)
+    else:
+        options["method"] = 4
+    temp_path = f"{path}.part"
+    image.save(temp_path, format=IMAGE_FORMAT.upper(), **options)
+    os.replace(temp_path, path)
+
+
+def render_variants(source_path: str, stem_path: str) -> dict:
+    """
+    Write every variant of source_path next to stem_path and return
+    {variant name: file path}. Runs in a worker process.
+    Raises InvalidImageError if the file is not a decodable image.
+    """
+    paths = {}
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            with Image.open(source_path) as original:
+                icc_profile = original.info.get("icc_profile")
+                image = ImageOps.exif_transpose(original)
+                if IMAGE_FORMAT == "jpeg" or image.mode not in ("RGB", "RGBA"):
+                    has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+                    image = image.convert("RGBA" if has_alpha and IMAGE_FORMAT != "jpeg" else "RGB")
+
+                for name, width in IMAGE_VARIANTS.items():
+                    variant = image
+                    if image.width > width:
+                        height = max(1, round(image.height * width / image.width))
+                        variant = image.resize((width, height), Image.LANCZOS)
+                    paths[name] = variant_path(stem_path, name)
+                    _encode(variant, paths[name], icc_profile)
+        return paths
+    except Exception as e:
+        # No dejar variantes a medias
+        for path in list(paths.values()) + [f"{path}.part" for path in paths.values()]:
+            if os.path.exists(path):
+                os.remove(path)
+        if isinstance(e, (UnidentifiedImageError, Image.DecompressionBombError, Image.DecompressionBombWarning, SyntaxError, ValueError)):
+            print(f"Imagen rechazada {source_path}: {str(e)}")
+            raise InvalidImageError("El archivo no es una imagen válida")
+        raise
+
+
+def to_model_jpeg(content: bytes) -> bytes:
+    """Re-encode image bytes as JPEG for vision models that can't read WebP."""
+    with Image.open(io.BytesIO(content)) as image:
+        if image.format == "JPEG":
+            return content
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=90)
+        return output.getvalue()
+
+
+class ImageProcessor:
+    def __init__(self, workers: int = IMAGE_WORKERS):
+        self.workers = workers
+        self._pool = None
+        self.stats = {"processed": 0, "invalid": 0}
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def stop(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+
+    async def process(self, source_path: str, stem_path: str) -> dict:
+        """Render the variants of source_path in the pool; returns {name: file path}."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        try:
+            paths = await loop.run_in_executor(self._pool, render_variants, source_path, stem_path)
+        except InvalidImageError:
+            self.stats["invalid"] += 1
+            raise
+        self.stats["processed"] += 1
+        return paths
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "workers": self.workers, "format": IMAGE_FORMAT, "variants": IMAGE_VARIANTS}
+
+
+image_processor = ImageProcessor()
@@ -0,0 +1,79 @@
+"""
+Request-scoped batching of user lookups by id.
+
+Routes take a UserLoader through the get_user_loader dependency. Every
+load(user_id) made in the same event loop tick (for example from an
+asyncio.gather, or load_many) is sent as a single $in query, and results
+are memoized for the rest of the request, so asking twice for the same user
+costs nothing. A new loader is created for each request, so nothing is
+cached across requests. Routes that write a user document call prime() with
+the updated document or clear() the id.
+"""
+import asyncio
+from .feed import fetch_authors
+
+USER_LOADER_PROJECTION = {"password": 0}
+
+
+class UserLoader:
+    def __init__(self, projection=USER_LOADER_PROJECTION):
+        self.projection = projection
+        self._results = {}
+        self._queue = []
+        self._tasks = set()
+        self.stats = {"loads": 0, "batches": 0}
+
+    def load(self, user_id: str) -> asyncio.Future:
+        """Awaitable resolving to the user document, or None if it doesn't exist."""
+        self.stats["loads"] += 1
+        future = self._results.get(user_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._results[user_id] = future
+            if not self._queue:
+                # Se despacha al final del tick, con todos los ids pedidos hasta entonces
+                loop.call_soon(self._dispatch)
+            self._queue.append((user_id, future))
+        return future
+
+    async def load_many(self, user_ids) -> dict:
+        """Load several users in one batch; returns the existing ones keyed by id string."""
+        user_ids = list(set(user_ids))
+        users = await asyncio.gather(*(self.load(user_id) for user_id in user_ids))
+        return {user_id: user for user_id, user in zip(user_ids, users) if user is not None}
+
+    def prime(self, user: dict):
+        """Store a document the route already has (e.g. after an update)."""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(user)
+        self._results[str(user["_id"])] = future
+
+    def clear(self, user_id: str):
+        self._results.pop(user_id, None)
+
+    def _dispatch(self):
+        batch, self._queue = self._queue, []
+        task = asyncio.ensure_future(self._fetch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, batch: list):
+        self.stats["batches"] += 1
+        try:
+            users = await fetch_authors([user_id for user_id, _ in batch], self.projection)
+        except Exception as e:
+            for user_id, future in batch:
+                # Sin memoizar el error: otro load() del mismo id vuelve a intentarlo
+                if self._results.get(user_id) is future:
+                    del self._results[user_id]
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for user_id, future in batch:
+            if not future.done():
+                future.set_result(users.get(user_id))
+
+
+async def get_user_loader() -> UserLoader:
+    return UserLoader()
@@ -0,0 +1,208 @@
+"""
+Serving helpers for /uploads.
+
+Blob files (uploads/blobs/...) are content-addressed, so their ETag is the
+file name and they are sent with a one-year immutable Cache-Control: the app
+never needs to revalidate them. Older uploads whose content can change under
+the same URL get an ETag from size and modification time and "no-cache", so
+clients revalidate and usually get a 304.
+
+Small, frequently requested files (thumbnails, avatars) are kept in memory in
+an LRU of at most MEDIA_CACHE_MAX_BYTES. A file is admitted on its second
+request, so one-off images don't push out the hot set. Files larger than
+MEDIA_CACHE_MAX_OBJECT_BYTES are always read from disk.
+"""
+import asyncio
+import email.utils
+import mimetypes
+import os
+import stat
+from collections import OrderedDict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from .uploads import UPLOAD_DIR
+
+load_dotenv()
+
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+MEDIA_CACHE_MAX_OBJECT_BYTES = int(os.getenv("MEDIA_CACHE_MAX_OBJECT_BYTES", str(256 * 1024)))
+MEDIA_CACHE_CANDIDATES = int(os.getenv("MEDIA_CACHE_CANDIDATES", "4096"))
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MUTABLE_CACHE_CONTROL = "no-cache"
+
+BLOB_PREFIX = os.path.join(UPLOAD_DIR, "blobs") + os.sep
+_UPLOAD_ROOT = os.path.realpath(UPLOAD_DIR) + os.sep
+
+
+@dataclass
+class MediaFile:
+    path: str
+    stat: os.stat_result
+    etag: str
+    immutable: bool
+    content_type: str
+
+    @property
+    def size(self) -> int:
+        return self.stat.st_size
+
+    def headers(self) -> dict:
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if self.immutable else MUTABLE_CACHE_CONTROL,
+            "Accept-Ranges": "bytes",
+            "X-Content-Type-Options": "nosniff"
+        }
+        if not self.immutable:
+            headers["Last-Modified"] = email.utils.formatdate(self.stat.st_mtime, usegmt=True)
+        return headers
+
+
+def resolve(url_path: str) -> str | None:
+    """File path for the part of the URL after /uploads/, or None if it's not servable."""
+    parts = url_path.split("/")
+    # Nada de rutas relativas ni ficheros ocultos (originales temporales, .part)
+    if any(not part or part.startswith(".") for part in parts):
+        return None
+    path = os.path.join(UPLOAD_DIR, *parts)
+    if not os.path.realpath(path).startswith(_UPLOAD_ROOT):
+        return None
+    return path
+
+
+def stat_media(path: str) -> MediaFile | None:
+    try:
+        result = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not stat.S_ISREG(result.st_mode):
+        return None
+    immutable = path.startswith(BLOB_PREFIX)
+    if immutable:
+        # El nombre ya es el hash del contenido
+        etag = f'"{os.path.splitext(os.path.basename(path))[0]}"'
+    else:
+        etag = f'"{result.st_size:x}-{result.st_mtime_ns:x}"'
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return MediaFile(path, result, etag, immutable, content_type)
+
+
+def matches_etag(header: str | None, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for it)."""
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    (start, end) inclusive for a single "bytes=" range; None to send the whole
+    file (no header, unknown unit or several ranges). Raises ValueError if
+    the range can't be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, separator, last = header[len("bytes="):].strip().partition("-")
+    # Cabeceras mal formadas se ignoran (RFC 9110) y se envía el fichero completo
+    if not separator or not (first or last) or not (first.isdigit() or not first) or not (last.isdigit() or not last):
+        return None
+    if not first:
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as media_file:
+        return media_file.read()
+
+
+async def iter_file_range(path: str, start: int, length: int):
+    media_file = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(media_file.seek, start)
+        while length > 0:
+            chunk = await asyncio.to_thread(media_file.read, min(MEDIA_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(media_file.close)
+
+
+class MediaCache:
+    def __init__(
+        self,
+        max_bytes: int = MEDIA_CACHE_MAX_BYTES,
+        max_object_bytes: int = MEDIA_CACHE_MAX_OBJECT_BYTES,
+        max_candidates: int = MEDIA_CACHE_CANDIDATES
+    ):
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.max_candidates = max_candidates
+        self._entries = OrderedDict()
+        self._candidates = OrderedDict()
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "admitted": 0, "evictions": 0}
+
+    def get(self, path: str) -> tuple[MediaFile, bytes] | None:
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        self._entries.move_to_end(path)
+        self.stats["hits"] += 1
+        return entry
+
+    async def fetch(self, media: MediaFile) -> bytes | None:
+        """The file's content if it is (now) cached; None if it should be read from disk."""
+        self.stats["misses"] += 1
+        if media.size > self.max_object_bytes or self.max_bytes <= 0:
+            return None
+        if media.path not in self._candidates:
+            # Primera petición: solo se recuerda la ruta
+            self._candidates[media.path] = None
+            while len(self._candidates) > self.max_candidates:
+                self._candidates.popitem(last=False)
+            return None
+
+        content = await asyncio.to_thread(_read, media.path)
+        self._candidates.pop(media.path, None)
+        if len(content) != media.size:
+            # El fichero cambió entre el stat y la lectura
+            return None
+        self.evict(media.path)
+        self._entries[media.path] = (media, content)
+        self._bytes += len(content)
+        self.stats["admitted"] += 1
+        while self._bytes > self.max_bytes:
+            _, (_, old_content) = self._entries.popitem(last=False)
+            self._bytes -= len(old_content)
+            self.stats["evictions"] += 1
+        return content
+
+    def evict(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def evict_prefix(self, prefix: str):
+        for path in [path for path in self._entries if path.startswith(prefix)]:
+            self.evict(path)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "entries": len(self._entries), "bytes": self._bytes}
+
+
+media_cache = MediaCache()
@@ -0,0 +1,157 @@
+"""
+One-off data migrations.
+
+Usage:
+    python -m app.utils.migrations author_private follow_edges timelines dedupe_toggles username_lower
+"""
+import asyncio
+import sys
+from datetime import datetime
+from bson import ObjectId
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+from ..database import users_collection, posts_collection, likes_collection, saved_posts_collection, follows_collection
+from .timeline import copy_recent_posts
+from .follows import following_ids
+from ..indexes import INDEXES
+from .user_search import normalize_username
+
+
+async def backfill_author_private():
+    """Copy each author's private_account flag onto their posts as author_private."""
+    updated = 0
+    async for user in users_collection.find({}, {"private_account": 1}):
+        result = await posts_collection.update_many(
+            {"author_id": str(user["_id"]), "author_private": {"$exists": False}},
+            {"$set": {"author_private": user.get("private_account", False)}}
+        )
+        updated += result.modified_count
+    print(f"author_private: {updated} posts updated")
+    return updated
+
+
+async def migrate_follow_edges():
+    """
+    Move the followers/following arrays of user documents into the follows
+    collection, then store followers_count/following_count and drop the arrays.
+    Edges listed on either side are kept; running it twice is harmless.
+    """
+    # El índice único es el que hace idempotente la migración
+    await follows_collection.create_indexes(INDEXES[follows_collection])
+    edges, users = 0, 0
+    async for user in users_collection.find(
+        {"$or": [{"followers": {"$exists": True}}, {"following": {"$exists": True}}]},
+        {"followers": 1, "following": 1}
+    ):
+        user_id = str(user["_id"])
+        pairs = {(user_id, followee) for followee in user.get("following", [])}
+        pairs |= {(follower, user_id) for follower in user.get("followers", [])}
+        now = datetime.utcnow().isoformat()
+        operations = [
+            InsertOne({"follower_id": follower, "followee_id": followee, "created_at": now})
+            for follower, followee in pairs if follower != followee
+        ]
+        if operations:
+            try:
+                result = await follows_collection.bulk_write(operations, ordered=False)
+                edges += result.inserted_count
+            except BulkWriteError as e:
+                # Pares ya migrados (índice único follower_id + followee_id)
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+                edges += e.details.get("nInserted", 0)
+        users += 1
+
+    # Los contadores se recalculan desde las aristas, que son la fuente de verdad
+    async for user in users_collection.find({}, {"_id": 1}):
+        user_id = str(user["_id"])
+        await users_collection.update_one(
+            {"_id": user["_id"]},
+            {
+                "$set": {
+                    "followers_count": await follows_collection.count_documents({"followee_id": user_id}),
+                    "following_count": await follows_collection.count_documents({"follower_id": user_id})
+                },
+                "$unset": {"followers": "", "following": ""}
+            }
+        )
+    print(f"follow_edges: {edges} edges created from {users} users")
+    return edges
+
+
+async def rebuild_timelines():
+    """Seed every user's precomputed timeline from their own and followed accounts' recent posts."""
+    users = 0
+    async for user in users_collection.find({}, {"_id": 1}):
+        user_id = str(user["_id"])
+        for author_id in [user_id] + await following_ids(user_id):
+            await copy_recent_posts(user_id, author_id)
+        users += 1
+    print(f"timelines: {users} timelines rebuilt")
+    return users
+
+
+async def dedupe_toggles():
+    """
+    Remove duplicate likes and saves so the unique (user_id, post_id) indexes
+    can be built, decrementing likes_count by the number of extra likes removed.
+    ensure_indexes() runs it by itself when duplicates block those indexes.
+    """
+    removed = 0
+    for collection in (likes_collection, saved_posts_collection):
+        duplicates = collection.aggregate([
+            {"$group": {"_id": {"user_id": "$user_id", "post_id": "$post_id"}, "ids": {"$push": "$_id"}}},
+            {"$match": {"ids.1": {"$exists": True}}}
+        ])
+        async for group in duplicates:
+            extra_ids = group["ids"][1:]
+            result = await collection.delete_many({"_id": {"$in": extra_ids}})
+            removed += result.deleted_count
+            if collection is likes_collection:
+                await posts_collection.update_one(
+                    {"_id": ObjectId(group["_id"]["post_id"])},
+                    {"$inc": {"likes_count": -result.deleted_count}}
+                )
+    print(f"dedupe_toggles: {removed} duplicate likes/saves removed")
+    return removed
+
+
+async def backfill_username_lower():
+    """Store the lowercase username used by the /users/search prefix index."""
+    updated = 0
+    async for user in users_collection.find({"username_lower": {"$exists": False}}, {"username": 1}):
+        await users_collection.update_one(
+            {"_id": user["_id"]},
+            {"$set": {"username_lower": normalize_username(user["username"])}}
+        )
+        updated += 1
+    print(f"username_lower: {updated} users updated")
+    return updated
+
+
+MIGRATIONS = {
+    "author_private": backfill_author_private,
+    "follow_edges": migrate_follow_edges,
+    "timelines": rebuild_timelines,
+    "dedupe_toggles": dedupe_toggles,
+    "username_lower": backfill_username_lower,
+}
+
+
+def main(argv):
+    names = argv or list(MIGRATIONS)
+    unknown = [name for name in names if name not in MIGRATIONS]
+    if unknown:
+        print(f"Unknown migrations: {', '.join(unknown)}. Available: {', '.join(MIGRATIONS)}")
+        return 1
+
+    async def run():
+        for name in names:
+            await MIGRATIONS[name]()
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
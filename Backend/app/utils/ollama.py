@@ -0,0 +1,154 @@
+"""
+Shared async client for the Ollama model server.
+
+All requests go through one httpx connection pool. A semaphore limits how many
+generations run on the model server at once (OLLAMA_MAX_CONCURRENCY); up to
+OLLAMA_MAX_QUEUE further requests wait for a slot for at most
+OLLAMA_QUEUE_TIMEOUT seconds, and anything beyond that is rejected with
+OllamaBusyError so callers can answer 429 instead of piling up.
+"""
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/generate")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "minicpm-v")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+OLLAMA_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "8"))
+OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "30"))
+
+COMMENT_PROMPT = "Imagina que estas en una red social, genera un comentario para un post de otra persona, positivo y natural en español para esta imagen. Responde el comentario solamente sin ninguna introduccion como aqui tienes un posible comentario"
+
+
+class OllamaError(Exception):
+    """The model server could not be reached or returned an error."""
+
+
+class OllamaBusyError(OllamaError):
+    """All generation slots are taken and the wait queue is full."""
+
+
+class OllamaClient:
+    def __init__(
+        self,
+        api_url: str = OLLAMA_API_URL,
+        max_concurrency: int = OLLAMA_MAX_CONCURRENCY,
+        max_queue: int = OLLAMA_MAX_QUEUE,
+        queue_timeout: float = OLLAMA_QUEUE_TIMEOUT,
+        timeout: float = OLLAMA_TIMEOUT,
+        connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+        transport: httpx.AsyncBaseTransport | None = None
+    ):
+        self.api_url = api_url
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        # Normalmente None; las pruebas pasan un servidor falso (httpx.MockTransport)
+        self._transport = transport
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                transport=self._transport,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+        return self._client
+
+    def is_busy(self) -> bool:
+        return self._semaphore.locked()
+
+    def is_saturated(self) -> bool:
+        """Whether a new request would be rejected right now."""
+        return self._semaphore.locked() and self._waiting >= self.max_queue
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one generation slot, queueing briefly if the server is saturated."""
+        if self.is_saturated():
+            raise OllamaBusyError("El servicio de IA está saturado")
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise OllamaBusyError("Tiempo de espera agotado para el servicio de IA")
+        finally:
+            self._waiting -= 1
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def generate(self, prompt: str, images: list | None = None, model: str = OLLAMA_MODEL) -> str:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "images": images or [],
+            "stream": False
+        }
+        async with self.slot():
+            try:
+                response = await self.client.post(self.api_url, json=payload)
+            except httpx.HTTPError as e:
+                raise OllamaError(f"Error de conexión con Ollama: {e}") from e
+        if response.status_code != 200:
+            print(f"Error de Ollama - Status Code: {response.status_code}")
+            print(f"Error de Ollama - Response: {response.text}")
+            raise OllamaError(response.text)
+        return response.json().get("response", "")
+
+    async def stream(self, prompt: str, images: list | None = None, model: str = OLLAMA_MODEL):
+        """
+        Yield response tokens as Ollama produces them. Closing the generator
+        (e.g. because the client disconnected) closes the upstream connection,
+        which makes Ollama abort the generation.
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "images": images or [],
+            "stream": True
+        }
+        async with self.slot():
+            try:
+                async with self.client.stream("POST", self.api_url, json=payload) as response:
+                    if response.status_code != 200:
+                        body = (await response.aread()).decode(errors="replace")
+                        print(f"Error de Ollama - Status Code: {response.status_code}")
+                        print(f"Error de Ollama - Response: {body}")
+                        raise OllamaError(body)
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("error"):
+                            raise OllamaError(chunk["error"])
+                        if chunk.get("response"):
+                            yield chunk["response"]
+                        if chunk.get("done"):
+                            break
+            except httpx.HTTPError as e:
+                raise OllamaError(f"Error de conexión con Ollama: {e}") from e
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+ollama_client = OllamaClient()
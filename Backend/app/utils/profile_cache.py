@@ -0,0 +1,91 @@
+"""
+In-process cache of the user profile data route handlers need.
+
+Access tokens only carry the user id and session id, so anything else about
+the caller (username, following list, privacy flag...) is read from here.
+The following list comes from the follows collection; followers are only
+cached as a count.
+Entries expire after PROFILE_CACHE_TTL seconds and the cache holds at most
+PROFILE_CACHE_MAX_ENTRIES users (least recently used are evicted first).
+Routes that change a profile or a follow relationship call invalidate().
+"""
+import os
+import time
+from collections import OrderedDict
+from bson import ObjectId
+from bson.errors import InvalidId
+from dotenv import load_dotenv
+from ..database import users_collection
+from .follows import following_ids
+
+load_dotenv()
+
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000"))
+
+PROFILE_PROJECTION = {
+    "username": 1,
+    "email": 1,
+    "profile_image_url": 1,
+    "profile_image_variants": 1,
+    "phone": 1,
+    "birth_date": 1,
+    "followers_count": 1,
+    "following_count": 1,
+    "private_account": 1
+}
+
+
+def to_profile(user: dict, following: list) -> dict:
+    return {
+        "user_id": str(user["_id"]),
+        "username": user.get("username", ""),
+        "email": user.get("email", ""),
+        "profile_image_url": user.get("profile_image_url"),
+        "profile_image_variants": user.get("profile_image_variants"),
+        "phone": user.get("phone"),
+        "birth_date": user.get("birth_date"),
+        "followers_count": user.get("followers_count", 0),
+        "following_count": user.get("following_count", 0),
+        "following": following,
+        "private_account": user.get("private_account", False)
+    }
+
+
+class ProfileCache:
+    def __init__(self, ttl: float = PROFILE_CACHE_TTL, max_entries: int = PROFILE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    async def get(self, user_id: str) -> dict | None:
+        """Return the user's profile, loading it from Mongo on a miss. None if the user doesn't exist."""
+        entry = self._entries.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return entry[1]
+
+        self.stats["misses"] += 1
+        try:
+            user = await users_collection.find_one({"_id": ObjectId(user_id)}, PROFILE_PROJECTION)
+        except InvalidId:
+            return None
+        if not user:
+            self._entries.pop(user_id, None)
+            return None
+
+        profile = to_profile(user, await following_ids(user_id))
+        self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return profile
+
+    def invalidate(self, *user_ids: str):
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+
+
+profile_cache = ProfileCache()
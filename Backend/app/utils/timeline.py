@@ -0,0 +1,170 @@
+"""
+Precomputed (fan-out-on-write) home timelines.
+
+When FEED_TIMELINE_MODE is enabled, every new post is written as one row per
+follower into the timelines collection, and GET /posts reads the user's
+timeline with a single indexed range scan on (owner_id, timestamp, post_id).
+In this mode the home feed contains the user's own posts and posts from the
+accounts they follow.
+
+Authors with more than FANOUT_FOLLOWER_THRESHOLD followers are not fanned out
+(only to themselves); their posts are pulled at read time and merged in.
+"""
+import os
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+from ..database import users_collection, posts_collection, timelines_collection
+from .feed import to_object_ids, before_cursor_filter, encode_cursor, FEED_SORT
+from .follows import iter_follower_ids
+
+load_dotenv()
+
+TIMELINE_MODE = os.getenv("FEED_TIMELINE_MODE", "false").lower() in ("1", "true", "yes")
+TIMELINE_MAX_ENTRIES = int(os.getenv("TIMELINE_MAX_ENTRIES", "800"))
+TIMELINE_BACKFILL_POSTS = int(os.getenv("TIMELINE_BACKFILL_POSTS", "50"))
+FANOUT_FOLLOWER_THRESHOLD = int(os.getenv("FANOUT_FOLLOWER_THRESHOLD", "5000"))
+
+TIMELINE_SORT = [("timestamp", -1), ("post_id", -1)]
+
+
+def is_celebrity(followers_count: int) -> bool:
+    return followers_count > FANOUT_FOLLOWER_THRESHOLD
+
+
+def _entry(owner_id: str, post: dict) -> dict:
+    return {
+        "owner_id": owner_id,
+        "post_id": post["_id"],
+        "author_id": post["author_id"],
+        "timestamp": post["timestamp"]
+    }
+
+
+async def _insert_entries(entries: list):
+    if not entries:
+        return
+    try:
+        await timelines_collection.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        # Entries already present (unique owner_id + post_id) are expected
+        non_duplicate = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+        if non_duplicate:
+            raise
+
+
+async def fan_out_post(post: dict, followers_count: int):
+    """Push a new post into the author's timeline and, below the threshold, each follower's."""
+    if not TIMELINE_MODE:
+        return
+    await _insert_entries([_entry(post["author_id"], post)])
+    if is_celebrity(followers_count):
+        return
+    async for followers in iter_follower_ids(post["author_id"]):
+        await _insert_entries([_entry(follower, post) for follower in followers if follower != post["author_id"]])
+
+
+async def remove_post(post_id: str):
+    if not TIMELINE_MODE:
+        return
+    await timelines_collection.delete_many({"post_id": ObjectId(post_id)})
+
+
+async def backfill_follow(follower_id: str, author_id: str):
+    """Copy the author's recent posts into a new follower's timeline."""
+    if not TIMELINE_MODE:
+        return
+    await copy_recent_posts(follower_id, author_id)
+
+
+async def copy_recent_posts(follower_id: str, author_id: str):
+    """Insert the author's newest posts into a timeline; celebrity authors are read on demand instead."""
+    author = await users_collection.find_one({"_id": ObjectId(author_id)}, {"followers_count": 1})
+    if not author or is_celebrity(author.get("followers_count", 0)):
+        return
+    posts = await posts_collection.find(
+        {"author_id": author_id},
+        {"author_id": 1, "timestamp": 1}
+    ).sort(FEED_SORT).to_list(TIMELINE_BACKFILL_POSTS)
+    await _insert_entries([_entry(follower_id, post) for post in posts])
+
+
+async def remove_follow(follower_id: str, author_id: str):
+    if not TIMELINE_MODE:
+        return
+    await timelines_collection.delete_many({"owner_id": follower_id, "author_id": author_id})
+
+
+async def trim_timeline(owner_id: str):
+    """Keep only the newest TIMELINE_MAX_ENTRIES rows of a timeline."""
+    oldest_kept = await timelines_collection.find(
+        {"owner_id": owner_id},
+        {"timestamp": 1, "post_id": 1}
+    ).sort(TIMELINE_SORT).skip(TIMELINE_MAX_ENTRIES - 1).limit(1).to_list(1)
+    if oldest_kept:
+        cursor = encode_cursor({"timestamp": oldest_kept[0]["timestamp"], "_id": oldest_kept[0]["post_id"]})
+        await timelines_collection.delete_many(
+            {"$and": [{"owner_id": owner_id}, before_cursor_filter(cursor, id_field="post_id")]}
+        )
+
+
+def _feed_key(post: dict) -> tuple:
+    return (post.get("timestamp", ""), post["_id"])
+
+
+async def read_timeline(user_id: str, following: list, before: str | None, limit: int) -> tuple[list, str | None]:
+    """
+    Return up to `limit` post documents for the user's home feed, newest
+    first, and the cursor of the next page (None on the last page).
+    Raises ValueError for a malformed cursor.
+
+    The cursor comes from the timeline rows and celebrity posts that were
+    read, not from the posts that resolved: rows whose post was deleted make
+    a page short but never end pagination early.
+    """
+    cursor_filter = before_cursor_filter(before, id_field="post_id") if before else {}
+    entries = await timelines_collection.find(
+        {"owner_id": user_id, **cursor_filter},
+        {"post_id": 1, "timestamp": 1}
+    ).sort(TIMELINE_SORT).to_list(limit)
+    post_ids = [entry["post_id"] for entry in entries]
+
+    posts = []
+    if post_ids:
+        posts = await posts_collection.find({"_id": {"$in": post_ids}}).to_list(len(post_ids))
+
+    # Hasta dónde llegó cada fuente que puede tener más filas: por debajo del
+    # más reciente de esos límites aún puede faltar algo por leer
+    boundaries = []
+    if len(entries) == limit:
+        boundaries.append((entries[-1].get("timestamp", ""), entries[-1]["post_id"]))
+
+    # Fan-out-on-read for the user and followed accounts above the threshold
+    celebrities = await users_collection.find(
+        {
+            "_id": {"$in": to_object_ids(list(following) + [user_id])},
+            "followers_count": {"$gt": FANOUT_FOLLOWER_THRESHOLD}
+        },
+        {"_id": 1}
+    ).to_list(None)
+    if celebrities:
+        query = {"author_id": {"$in": [str(user["_id"]) for user in celebrities]}}
+        if before:
+            query = {"$and": [query, before_cursor_filter(before)]}
+        celebrity_posts = await posts_collection.find(query).sort(FEED_SORT).to_list(limit)
+        if len(celebrity_posts) == limit:
+            boundaries.append(_feed_key(celebrity_posts[-1]))
+        posts.extend(celebrity_posts)
+
+    unique_posts = {post["_id"]: post for post in posts}
+    page = sorted(unique_posts.values(), key=_feed_key, reverse=True)
+    if boundaries:
+        boundary = max(boundaries)
+        page = [post for post in page if _feed_key(post) >= boundary]
+
+    if len(page) > limit:
+        page = page[:limit]
+        return page, encode_cursor(page[-1])
+    if boundaries:
+        return page, encode_cursor({"timestamp": boundary[0], "_id": boundary[1]})
+    return page, None
@@ -0,0 +1,94 @@
+"""
+Streaming writer for uploaded files.
+
+Uploads are copied to disk in UPLOAD_CHUNK_SIZE pieces, with the file I/O
+done in worker threads, so the event loop never blocks on the disk and a
+handler holds at most one chunk in memory. The size limit is checked as
+bytes arrive: an oversized upload is rejected with 413 as soon as it goes
+over UPLOAD_MAX_BYTES (or before reading anything, if the multipart parser
+already knows the size). Data goes to a hidden temporary file in the target
+directory that is renamed into place only once it is complete, so readers
+never see a half-written image.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from fastapi import HTTPException, UploadFile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "uploads")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(16 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Create uploads directory if it doesn't exist
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+
+def temp_upload_path(filename: str | None) -> str:
+    """Hidden, unique path in UPLOAD_DIR for an upload that is processed and then discarded."""
+    extension = os.path.splitext(filename or "")[1]
+    return os.path.join(UPLOAD_DIR, f".{uuid.uuid4().hex}{extension}")
+
+
+def upload_url(path: str) -> str:
+    """Public URL of a file under UPLOAD_DIR."""
+    return "/uploads/" + os.path.relpath(path, UPLOAD_DIR).replace(os.sep, "/")
+
+
+def upload_path(url: str) -> str:
+    """File path of an /uploads/... URL; the inverse of upload_url."""
+    return os.path.join(UPLOAD_DIR, *url.removeprefix("/uploads/").split("/"))
+
+
+def too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"El archivo es demasiado grande. El tamaño máximo permitido es {UPLOAD_MAX_BYTES // (1024 * 1024)}MB"
+    )
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def save_upload(upload: UploadFile, path: str, max_bytes: int = UPLOAD_MAX_BYTES) -> tuple[int, str]:
+    """
+    Stream upload to path, replacing any existing file atomically.
+    Returns (bytes written, SHA-256 hex digest of the content), hashed while
+    streaming. Raises HTTPException(413) if the upload is larger than
+    max_bytes; nothing is left on disk in that case.
+    """
+    if getattr(upload, "size", None) is not None and upload.size > max_bytes:
+        raise too_large()
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{uuid.uuid4().hex}.part")
+
+    written = 0
+    digest = hashlib.sha256()
+    buffer = await asyncio.to_thread(open, temp_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise too_large()
+            digest.update(chunk)
+            await asyncio.to_thread(buffer.write, chunk)
+        await asyncio.to_thread(buffer.close)
+        await asyncio.to_thread(os.replace, temp_path, path)
+    except BaseException:
+        # También en cancelaciones: no dejar ficheros temporales a medias
+        buffer.close()
+        await asyncio.shield(asyncio.to_thread(_remove_quietly, temp_path))
+        raise
+    return written, digest.hexdigest()
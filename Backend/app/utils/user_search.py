@@ -0,0 +1,335 @@
+"""
+Username search for /users/search.
+
+Every user stores its username lowercased in username_lower, which has its
+own index, so prefix lookups are a range scan on that index. Infix matches
+("ana" inside "mariana") come from an in-memory trigram index over all
+usernames. The index is loaded in the background on startup, and register,
+profile updates and follows keep it current in this process. Other
+processes only see those changes after their next restart.
+
+Results are ranked exact match > prefix > infix (earlier position first),
+then by follower count. Queries shorter than three characters, queries so
+common that they would scan more than SEARCH_MAX_CANDIDATES users, and any
+query while the trigram index is still loading use the prefix path only.
+The prefix path ranks every match in Mongo with the same order before
+applying the limit, so popular users are found whatever their name sorts as.
+
+The Android search screen sends one request per keystroke, so results are
+cached per normalized query for SEARCH_CACHE_TTL seconds (LRU, at most
+SEARCH_CACHE_MAX_ENTRIES queries). Concurrent identical queries share a
+single database round trip. A query is also answered in memory when a
+shorter prefix of it is cached with fewer results than its limit, because
+that cached list already holds every possible match.
+"""
+import asyncio
+import heapq
+import os
+import time
+from collections import OrderedDict, defaultdict
+from dotenv import load_dotenv
+from ..database import users_collection
+from .feed import to_object_ids
+
+load_dotenv()
+
+SEARCH_TRIGRAM = os.getenv("SEARCH_TRIGRAM", "true").lower() in ("1", "true", "yes")
+# Consultas tan comunes que su trigrama más raro supera este número de usuarios van por prefijo
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "20000"))
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "10"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2000"))
+
+SEARCH_PROJECTION = {"password": 0}
+
+
+def normalize_username(username: str) -> str:
+    return username.strip().lower()
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def rank_key(query: str, name: str, followers: int) -> tuple:
+    """Sort key for a username containing query; smaller is better."""
+    position = name.find(query)
+    if name == query:
+        match = 0
+    elif position == 0:
+        match = 1
+    else:
+        match = 2
+    return (match, position, -followers, len(name), name)
+
+
+class TrigramIndex:
+    """
+    Trigram -> users posting lists over lowercase usernames.
+
+    Users are numbered with internal slots so posting lists are plain lists of
+    ints. Renames only append the new trigrams: stale postings are harmless
+    because every candidate is checked against the current name.
+    """
+
+    def __init__(self, max_candidates: int = SEARCH_MAX_CANDIDATES):
+        self.max_candidates = max_candidates
+        self._slots = {}
+        self._ids = []
+        self._names = []
+        self._followers = []
+        self._postings = defaultdict(list)
+        self._task = None
+        self.ready = False
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, user_id: str, username: str, followers: int | None = None):
+        """Insert a user or update its username (and follower count if given)."""
+        name = normalize_username(username)
+        slot = self._slots.get(user_id)
+        if slot is None:
+            slot = len(self._ids)
+            self._slots[user_id] = slot
+            self._ids.append(user_id)
+            self._names.append(None)
+            self._followers.append(0)
+        if self._names[slot] != name:
+            old_grams = trigrams(self._names[slot]) if self._names[slot] else set()
+            for gram in trigrams(name) - old_grams:
+                self._postings[gram].append(slot)
+            self._names[slot] = name
+        if followers is not None:
+            self._followers[slot] = followers
+
+    def adjust_followers(self, user_id: str, delta: int):
+        slot = self._slots.get(user_id)
+        if slot is not None:
+            self._followers[slot] = max(0, self._followers[slot] + delta)
+
+    def remove(self, user_id: str):
+        slot = self._slots.get(user_id)
+        if slot is not None:
+            self._names[slot] = None
+
+    def _candidates(self, query: str) -> list | None:
+        grams = trigrams(query)
+        if not self.ready or not grams:
+            return None
+
+        postings = []
+        for gram in grams:
+            if gram not in self._postings:
+                return []
+            postings.append(self._postings[gram])
+        candidates = min(postings, key=len)
+        if len(candidates) > self.max_candidates:
+            return None
+        return candidates
+
+    def answers(self, query: str) -> bool:
+        """Whether search() would answer query (with infix matches) rather than return None."""
+        return self._candidates(normalize_username(query)) is not None
+
+    def search(self, query: str, limit: int) -> list | None:
+        """
+        Ids of the best `limit` users whose username contains query, best first.
+        None when the index can't answer (still loading, query too short or too common).
+        """
+        query = normalize_username(query)
+        candidates = self._candidates(query)
+        if candidates is None:
+            return None
+
+        # Basta con recorrer la lista más corta y comprobar el nombre actual.
+        # Se agrupa por posición de la coincidencia, el primer criterio del ranking,
+        # para ordenar solo los grupos necesarios para llenar el límite
+        names, followers = self._names, self._followers
+        by_position = defaultdict(set)
+        for slot in candidates:
+            name = names[slot]
+            if name is not None:
+                position = name.find(query)
+                if position >= 0:
+                    by_position[position].add(slot)
+
+        best = []
+        for position in sorted(by_position):
+            if len(best) >= limit:
+                break
+            # Dentro de un grupo la posición es la misma: rank_key sin recalcularla
+            best.extend(heapq.nsmallest(
+                limit - len(best),
+                by_position[position],
+                key=lambda slot: (names[slot] != query, -followers[slot], len(names[slot]), names[slot])
+            ))
+        return [self._ids[slot] for slot in best]
+
+    async def load(self):
+        loaded = 0
+        users = users_collection.find(
+            {},
+            {"username": 1, "followers_count": 1}
+        )
+        async for user in users:
+            self.add(str(user["_id"]), user["username"], user.get("followers_count", 0))
+            loaded += 1
+        self.ready = True
+        print(f"Índice de búsqueda de usuarios cargado: {loaded} usuarios")
+
+    async def _load_safely(self):
+        try:
+            await self.load()
+        except Exception as e:
+            print(f"No se pudo cargar el índice de búsqueda, se usa solo el prefijo: {str(e)}")
+
+    def start(self):
+        if SEARCH_TRIGRAM and self._task is None:
+            self._task = asyncio.create_task(self._load_safely())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def get_stats(self) -> dict:
+        return {"ready": self.ready, "users": len(self), "trigrams": len(self._postings)}
+
+
+search_index = TrigramIndex()
+
+
+def _user_name(user: dict) -> str:
+    return user.get("username_lower") or normalize_username(user["username"])
+
+
+def _user_rank_key(query: str, user: dict) -> tuple:
+    return rank_key(query, _user_name(user), user.get("followers_count", 0))
+
+
+class SearchCache:
+    """
+    Short-lived LRU of ranked search results. Each entry remembers the limit
+    it was computed with and whether it holds infix or prefix-only matches;
+    an entry with fewer results than its limit is complete.
+    """
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.stats = {"hits": 0, "narrowed": 0, "coalesced": 0, "misses": 0}
+
+    def _lookup(self, query: str):
+        entry = self._entries.get(query)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[query]
+            return None
+        self._entries.move_to_end(query)
+        return entry
+
+    def _store(self, query: str, limit: int, infix: bool, users: list):
+        self._entries[query] = (time.monotonic() + self.ttl, limit, infix, users)
+        self._entries.move_to_end(query)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _narrow(self, query: str, limit: int, infix: bool) -> list | None:
+        """Filter the longest cached complete result for a prefix of query, if any."""
+        for length in range(len(query) - 1, 0, -1):
+            entry = self._lookup(query[:length])
+            if entry is None:
+                continue
+            _, entry_limit, entry_infix, users = entry
+            if len(users) >= entry_limit or entry_infix != infix:
+                continue
+            if infix:
+                matches = [user for user in users if query in _user_name(user)]
+            else:
+                matches = [user for user in users if _user_name(user).startswith(query)]
+            matches.sort(key=lambda user: _user_rank_key(query, user))
+            return matches[:limit]
+        return None
+
+    async def _load(self, query: str, limit: int, loader) -> list:
+        users, infix = await loader(query, limit)
+        self._store(query, limit, infix, users)
+        return users
+
+    async def get(self, query: str, limit: int, loader) -> list:
+        """Cached results for a normalized query; loader(query, limit) -> (users, infix) on a miss."""
+        entry = self._lookup(query)
+        if entry is not None and (entry[1] >= limit or len(entry[3]) < entry[1]):
+            self.stats["hits"] += 1
+            return entry[3][:limit]
+
+        infix = search_index.answers(query)
+        narrowed = self._narrow(query, limit, infix)
+        if narrowed is not None:
+            self.stats["narrowed"] += 1
+            self._store(query, limit, infix, narrowed)
+            return narrowed
+
+        # Peticiones idénticas simultáneas comparten la misma consulta a Mongo
+        key = (query, limit)
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(self._load(query, limit, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "size": len(self._entries), "inflight": len(self._inflight)}
+
+
+search_cache = SearchCache()
+
+
+async def _search_prefix(query: str, limit: int) -> list:
+    """Best `limit` users whose username starts with query, in rank_key order."""
+    # Rango sobre el índice de username_lower; Mongo ordena todas las coincidencias
+    # (top-k con $sort + $limit) en lugar de quedarse con las primeras alfabéticamente
+    return await users_collection.aggregate([
+        {"$match": {"username_lower": {"$gte": query, "$lt": query + "\uffff"}}},
+        {"$addFields": {
+            "_exact": {"$eq": ["$username_lower", query]},
+            "_followers": {"$ifNull": ["$followers_count", 0]},
+            "_length": {"$strLenCP": "$username_lower"}
+        }},
+        {"$sort": {"_exact": -1, "_followers": -1, "_length": 1, "username_lower": 1}},
+        {"$limit": limit},
+        {"$project": {**SEARCH_PROJECTION, "_exact": 0, "_followers": 0, "_length": 0}}
+    ]).to_list(limit)
+
+
+async def _search_uncached(query: str, limit: int) -> tuple[list, bool]:
+    ranked_ids = search_index.search(query, limit)
+
+    if ranked_ids is None:
+        return await _search_prefix(query, limit), False
+
+    if not ranked_ids:
+        return [], True
+    users = await users_collection.find(
+        {"_id": {"$in": to_object_ids(ranked_ids)}},
+        SEARCH_PROJECTION
+    ).to_list(len(ranked_ids))
+    by_id = {str(user["_id"]): user for user in users}
+    return [by_id[user_id] for user_id in ranked_ids if user_id in by_id], True
+
+
+async def search_users(query: str, limit: int) -> list:
+    """Return up to `limit` user documents matching query, best match first."""
+    return await search_cache.get(normalize_username(query), limit, _search_uncached)
@@ -0,0 +1,98 @@
+"""
+Follow storm load benchmark.
+
+Registers one target account and N follower accounts against a running API,
+then has every follower follow the target at once (with a bounded number of
+requests in flight), and then unfollow it the same way. Reports latency
+percentiles and throughput for each storm, and checks that the target's
+followers_count ends up at N and then back at 0 once the counter buffer has
+flushed.
+
+Needs a running server and MongoDB. Registering the followers is bcrypt-bound
+and is not part of the measured phase.
+
+Usage (from Backend/):
+    uvicorn main:app --port 8000 &
+    python -m benchmarks.follow_storm --base-url http://localhost:8000 --followers 500 --concurrency 100
+"""
+import argparse
+import asyncio
+import time
+import uuid
+import httpx
+
+
+def percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+    return f"p50 {pick(0.50):7.1f} ms  p95 {pick(0.95):7.1f} ms  p99 {pick(0.99):7.1f} ms"
+
+
+async def register(client: httpx.AsyncClient, prefix: str, index: int) -> str:
+    username = f"{prefix}_{index}"
+    response = await client.post("/register", json={
+        "username": username,
+        "password": "benchmark-password",
+        "email": f"{username}@example.com"
+    })
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def storm(client: httpx.AsyncClient, action: str, target_id: str, follower_ids: list, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(follower_id: str):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(f"/users/{target_id}/{action}", params={"current_user_id": follower_id})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(follower_id) for follower_id in follower_ids))
+    elapsed = time.perf_counter() - start
+    return {"latencies": latencies, "errors": errors, "per_second": len(follower_ids) / elapsed}
+
+
+async def followers_count(client: httpx.AsyncClient, target_id: str) -> int:
+    response = await client.get(f"/users/{target_id}")
+    response.raise_for_status()
+    return response.json()["followers_count"]
+
+
+async def main(args):
+    prefix = f"storm{uuid.uuid4().hex[:8]}"
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60, verify=False) as client:
+        print(f"Registering 1 target and {args.followers} followers...")
+        target_id = await register(client, prefix, 0)
+        registering = asyncio.Semaphore(8)
+
+        async def register_follower(index: int) -> str:
+            async with registering:
+                return await register(client, prefix, index)
+
+        follower_ids = await asyncio.gather(*(register_follower(i) for i in range(1, args.followers + 1)))
+
+        for action, expected in (("follow", args.followers), ("unfollow", 0)):
+            result = await storm(client, action, target_id, follower_ids, args.concurrency)
+            await asyncio.sleep(args.settle)
+            count = await followers_count(client, target_id)
+            print(
+                f"{action:>8}: {percentiles(result['latencies'])}  "
+                f"{result['per_second']:7.1f} req/s  errors {result['errors']}  "
+                f"followers_count {count} (expected {expected})"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--followers", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds to wait for the counter flush")
+    asyncio.run(main(parser.parse_args()))
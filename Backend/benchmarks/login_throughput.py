@@ -0,0 +1,75 @@
+"""
+Password verification throughput and event-loop latency benchmark.
+
+Runs a burst of bcrypt verifications the way /login does, once inline on the
+event loop (the old behaviour) and once through the verify_password worker
+pool, and reports logins/s, logins/s per core and the worst event-loop stall
+seen by a 10 ms heartbeat task. No database is needed.
+
+Usage (from Backend/):
+    python -m benchmarks.login_throughput --logins 64 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import time
+
+
+async def heartbeat(stalls: list, stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def run(mode: str, logins: int, hashed: str, pwd_context, verify_password) -> dict:
+    stalls, stop = [], asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(stalls, stop))
+    await asyncio.sleep(0)
+
+    async def login_inline():
+        pwd_context.verify("benchmark-password", hashed)
+
+    async def login_pooled():
+        await verify_password("benchmark-password", hashed)
+
+    login = login_inline if mode == "inline" else login_pooled
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await monitor
+    return {
+        "mode": mode,
+        "logins_per_s": logins / elapsed,
+        "max_loop_stall_ms": max(stalls, default=0.0) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    # The settings are read at import time
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    from app.utils.auth import pwd_context, verify_password
+
+    hashed = pwd_context.hash("benchmark-password")
+    cores = os.cpu_count() or 1
+    print(f"bcrypt rounds={args.rounds} workers={args.workers} cores={cores} logins={args.logins}")
+    for mode in ("inline", "pooled"):
+        result = asyncio.run(run(mode, args.logins, hashed, pwd_context, verify_password))
+        print(
+            f"{result['mode']:>7}: {result['logins_per_s']:8.1f} logins/s "
+            f"({result['logins_per_s'] / cores:6.1f} per core), "
+            f"max event-loop stall {result['max_loop_stall_ms']:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
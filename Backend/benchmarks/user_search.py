@@ -0,0 +1,112 @@
+"""
+Username search latency benchmark.
+
+Builds a synthetic set of usernames (1M by default) and times the same
+keystroke-like queries against three strategies, all in memory so no
+database is needed:
+
+    regex    unanchored case-insensitive regex over every username (the old query)
+    prefix   range scan over sorted lowercase usernames, ranking every match and
+             keeping the top --limit (what the _search_prefix aggregation does)
+    trigram  TrigramIndex.search, the infix path of /users/search
+
+Reports p50/p95/p99 latency per strategy and the trigram index build time.
+
+Usage (from Backend/):
+    python -m benchmarks.user_search --users 1000000 --queries 200
+"""
+import argparse
+import bisect
+import heapq
+import random
+import re
+import time
+
+SYLLABLES = ["ma", "ri", "an", "jo", "se", "lu", "pa", "bl", "lo", "pe", "ez", "car", "los", "ana", "sof", "ia", "dan", "el"]
+
+
+def make_usernames(count: int, rng: random.Random) -> list:
+    names = set()
+    while len(names) < count:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.6:
+            name += "_" if rng.random() < 0.3 else ""
+            name += str(rng.randint(0, 9999))
+        if rng.random() < 0.2:
+            name = name.capitalize()
+        names.add(name[:30])
+    return list(names)
+
+
+def make_queries(usernames: list, count: int, rng: random.Random) -> list:
+    queries = []
+    for _ in range(count):
+        name = rng.choice(usernames).lower()
+        length = rng.randint(1, min(6, len(name)))
+        start = 0 if rng.random() < 0.5 else rng.randint(0, len(name) - length)
+        queries.append(name[start:start + length])
+    return queries
+
+
+def percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+    return f"p50 {pick(0.50):8.2f} ms  p95 {pick(0.95):8.2f} ms  p99 {pick(0.99):8.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--regex-queries", type=int, default=20, help="the full scan is slow; run fewer of them")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from app.utils.user_search import TrigramIndex, rank_key
+
+    rng = random.Random(args.seed)
+    usernames = make_usernames(args.users, rng)
+    followers = [int(rng.paretovariate(1.2)) for _ in usernames]
+    queries = make_queries(usernames, args.queries, rng)
+    print(f"users={len(usernames)} queries={len(queries)} limit={args.limit}")
+
+    start = time.perf_counter()
+    index = TrigramIndex()
+    for position, name in enumerate(usernames):
+        index.add(str(position), name, followers[position])
+    index.ready = True
+    print(f"trigram index built in {time.perf_counter() - start:.1f} s ({index.get_stats()['trigrams']} trigrams)")
+
+    lowered = sorted((name.lower(), position) for position, name in enumerate(usernames))
+    keys = [name for name, _ in lowered]
+
+    def regex_search(query):
+        pattern = re.compile(f".*{re.escape(query)}.*", re.IGNORECASE)
+        return [name for name in usernames if pattern.match(name)][:args.limit]
+
+    def prefix_search(query):
+        low = bisect.bisect_left(keys, query)
+        high = bisect.bisect_left(keys, query + "\uffff", low)
+        # Como $sort + $limit en el servidor: se ordenan todas las coincidencias, no solo las primeras
+        return heapq.nsmallest(args.limit, lowered[low:high], key=lambda entry: rank_key(query, entry[0], followers[entry[1]]))
+
+    def trigram_search(query):
+        result = index.search(query, args.limit)
+        return prefix_search(query) if result is None else result
+
+    for label, search, subset in (
+        ("regex", regex_search, queries[:args.regex_queries]),
+        ("prefix", prefix_search, queries),
+        ("trigram", trigram_search, queries),
+    ):
+        samples = []
+        for query in subset:
+            start = time.perf_counter()
+            search(query)
+            samples.append(time.perf_counter() - start)
+        print(f"{label:>8}: {percentiles(samples)}  ({len(subset)} queries)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,35 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import users, posts, messages, ai_routes
-from fastapi.staticfiles import StaticFiles
+from app.routes import users, posts, messages, ai_routes, media
+from app.indexes import ensure_indexes
+from app.utils.counters import post_counters, user_counters
+from app.utils.ollama import ollama_client
+from app.utils.ai_jobs import ai_jobs
+from app.utils.user_search import search_index
+from app.utils.images import image_processor
+from app.utils.cleanup import garbage_collector
 
 app = FastAPI()
 
-# Mount the uploads directory for serving images
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+@app.on_event("startup")
+async def startup():
+    await ensure_indexes()
+    post_counters.start()
+    user_counters.start()
+    ai_jobs.start()
+    search_index.start()
+    image_processor.start()
+    garbage_collector.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await post_counters.stop()
+    await user_counters.stop()
+    await ai_jobs.stop()
+    await search_index.stop()
+    await image_processor.stop()
+    await garbage_collector.stop()
+    await ollama_client.aclose()
 
 # Configure CORS
 app.add_middleware(
@@ -22,6 +45,8 @@ app.include_router(users.router)
 app.include_router(posts.router)
 app.include_router(messages.router)
 app.include_router(ai_routes.router)
+# /uploads: ETag, rangos y caché de objetos calientes (sustituye al StaticFiles)
+app.include_router(media.router)
 
 if __name__ == "__main__":
     uvicorn.run(
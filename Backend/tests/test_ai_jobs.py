@@ -0,0 +1,159 @@
+"""
+AIJobQueue with a stubbed model client: everything runs in process, no
+Ollama or Mongo needed. Run from Backend/:
+
+    python -m pytest tests        # or: python -m unittest discover tests
+"""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from PIL import Image
+from app.utils import ai_jobs as ai_jobs_module
+from app.utils.ai_cache import AICommentCache
+from app.utils.ai_jobs import AIJobQueue, post_cache_key
+from app.utils.ollama import OllamaError
+
+
+class StubOllama:
+    """Replaces ollama_client: answers with the post id, can fail a number of times or stall."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = []
+        self.call_times = []
+        self.started = asyncio.Event()
+        self.hold = None
+
+    def is_busy(self) -> bool:
+        return False
+
+    async def generate(self, prompt: str, images: list | None = None) -> str:
+        self.calls.append(images[0])
+        self.call_times.append(time.monotonic())
+        self.started.set()
+        if self.hold is not None:
+            await self.hold.wait()
+        if self.failures:
+            self.failures -= 1
+            raise OllamaError("modelo no disponible")
+        return f"comentario {len(self.calls)}"
+
+
+class AIJobQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ollama = StubOllama()
+        self.cache = AICommentCache(persist=False)
+        self.images = {}
+        self.patches = [
+            mock.patch.object(ai_jobs_module, "ollama_client", self.ollama),
+            mock.patch.object(ai_jobs_module, "comment_cache", self.cache),
+            mock.patch.object(ai_jobs_module, "AI_IDLE_POLL_SECONDS", 0.01)
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    async def asyncTearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.directory.cleanup()
+
+    def job(self, post_id: str) -> dict:
+        # Cada post con una imagen distinta para poder saber qué se procesó
+        path = os.path.join(self.directory.name, f"{post_id}.jpg")
+        Image.new("RGB", (4, 4), (len(self.images) * 40 % 256, 0, 0)).save(path, format="JPEG")
+        self.images[post_id] = path
+        return {"post_id": post_id, "image_path": path}
+
+    def processed_posts(self, queue_calls: list) -> list:
+        by_image = {}
+        for post_id, path in self.images.items():
+            by_image[ai_jobs_module._read_image_base64(path)[0]] = post_id
+        return [by_image[image] for image in queue_calls]
+
+    async def wait_for(self, condition, timeout: float = 2):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("timed out waiting for the job queue")
+            await asyncio.sleep(0.005)
+
+    async def test_jobs_run_in_priority_order(self):
+        queue = AIJobQueue(workers=1, max_size=10)
+        queue.enqueue(self.job("late"), priority=20)
+        queue.enqueue(self.job("first"), priority=1)
+        queue.enqueue(self.job("second"), priority=10)
+        queue.enqueue(self.job("third"), priority=10)
+
+        queue.start()
+        try:
+            await self.wait_for(lambda: queue.stats["completed"] == 4)
+        finally:
+            await queue.stop()
+
+        # Menor prioridad primero; a igual prioridad, orden de llegada
+        self.assertEqual(self.processed_posts(self.ollama.calls), ["first", "second", "third", "late"])
+        self.assertEqual(await self.cache.pick(post_cache_key("first")), "comentario 1")
+
+    async def test_failed_job_is_retried_with_backoff(self):
+        self.ollama.failures = 2
+        queue = AIJobQueue(workers=1, max_size=10, retries=3, retry_delay=0.02)
+        queue.enqueue(self.job("post"))
+
+        queue.start()
+        try:
+            await self.wait_for(lambda: queue.stats["completed"] == 1)
+        finally:
+            await queue.stop()
+
+        self.assertEqual(len(self.ollama.calls), 3)
+        first_wait = self.ollama.call_times[1] - self.ollama.call_times[0]
+        second_wait = self.ollama.call_times[2] - self.ollama.call_times[1]
+        # retry_delay * 2^intento: 0.04 s y luego 0.08 s
+        self.assertGreaterEqual(first_wait, 0.04)
+        self.assertGreaterEqual(second_wait, 0.08)
+        self.assertEqual(queue.stats["failed"], 0)
+
+    async def test_job_is_dropped_after_max_retries(self):
+        self.ollama.failures = 10
+        queue = AIJobQueue(workers=1, max_size=10, retries=2, retry_delay=0.005)
+        queue.enqueue(self.job("post"))
+
+        queue.start()
+        try:
+            await self.wait_for(lambda: queue.stats["failed"] == 1)
+        finally:
+            await queue.stop()
+
+        # El intento original más dos reintentos
+        self.assertEqual(len(self.ollama.calls), 3)
+        self.assertEqual(queue.stats["completed"], 0)
+
+    async def test_bounded_queue_drops_jobs_when_full(self):
+        queue = AIJobQueue(workers=1, max_size=2)
+        self.assertTrue(queue.enqueue(self.job("a")))
+        self.assertTrue(queue.enqueue(self.job("b")))
+        self.assertFalse(queue.enqueue(self.job("c")))
+        self.assertEqual(queue.get_stats()["dropped"], 1)
+        self.assertEqual(queue.get_stats()["pending"], 2)
+
+    async def test_stop_with_full_queue_drops_the_running_job(self):
+        self.ollama.hold = asyncio.Event()
+        queue = AIJobQueue(workers=1, max_size=1)
+        queue.enqueue(self.job("running"))
+        queue.start()
+        await self.ollama.started.wait()
+        # El hueco que liberó el trabajo en curso se vuelve a ocupar antes del apagado
+        self.assertTrue(queue.enqueue(self.job("waiting")))
+
+        await queue.stop()
+
+        self.assertEqual(queue.stats["dropped"], 1)
+        self.assertEqual(queue.get_stats()["pending"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
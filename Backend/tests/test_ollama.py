@@ -0,0 +1,148 @@
+"""
+OllamaClient against a fake Ollama server (httpx.MockTransport), so no model
+server is needed. Run from Backend/:
+
+    python -m pytest tests        # or: python -m unittest discover tests
+"""
+import asyncio
+import json
+import unittest
+from unittest import mock
+import httpx
+from fastapi import FastAPI
+from app.utils.auth import get_current_user
+from app.utils.ollama import OllamaClient, OllamaError, OllamaBusyError, COMMENT_PROMPT
+from app.routes import ai_routes
+
+FAKE_URL = "http://ollama.test/api/generate"
+
+
+class FakeOllama:
+    """Stand-in for POST /api/generate that records requests and can stall or fail on demand."""
+
+    def __init__(self, reply: str = "¡Qué foto tan bonita!"):
+        self.reply = reply
+        self.requests = []
+        self.started = asyncio.Event()
+        self.hold = None
+        self.fail_with = None
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(json.loads(request.content))
+        self.started.set()
+        if self.hold is not None:
+            await self.hold.wait()
+        if self.fail_with is not None:
+            raise self.fail_with
+        return httpx.Response(200, json={"model": "fake", "response": self.reply, "done": True})
+
+    def client(self, **options) -> OllamaClient:
+        return OllamaClient(api_url=FAKE_URL, transport=httpx.MockTransport(self.handler), **options)
+
+
+class OllamaClientTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FakeOllama()
+
+    async def test_generate_returns_response(self):
+        client = self.server.client()
+        try:
+            comment = await client.generate(COMMENT_PROMPT, ["aW1hZ2Vu"], model="minicpm-v")
+        finally:
+            await client.aclose()
+
+        self.assertEqual(comment, "¡Qué foto tan bonita!")
+        self.assertEqual(self.server.requests, [{
+            "model": "minicpm-v",
+            "prompt": COMMENT_PROMPT,
+            "images": ["aW1hZ2Vu"],
+            "stream": False
+        }])
+        self.assertFalse(client.is_busy())
+
+    async def test_timeout_raises_ollama_error_and_frees_the_slot(self):
+        self.server.fail_with = httpx.ReadTimeout("timed out")
+        client = self.server.client(max_concurrency=1)
+        try:
+            with self.assertRaises(OllamaError) as raised:
+                await client.generate(COMMENT_PROMPT)
+            self.assertNotIsInstance(raised.exception, OllamaBusyError)
+            self.assertFalse(client.is_busy())
+
+            # El siguiente intento vuelve a llegar al servidor
+            self.server.fail_with = None
+            self.assertEqual(await client.generate(COMMENT_PROMPT), "¡Qué foto tan bonita!")
+        finally:
+            await client.aclose()
+
+    async def test_queue_timeout_raises_busy(self):
+        self.server.hold = asyncio.Event()
+        client = self.server.client(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+        first = asyncio.create_task(client.generate(COMMENT_PROMPT))
+        try:
+            await self.server.started.wait()
+            with self.assertRaises(OllamaBusyError):
+                await client.generate(COMMENT_PROMPT)
+        finally:
+            self.server.hold.set()
+            await first
+            await client.aclose()
+        self.assertEqual(len(self.server.requests), 1)
+
+    async def test_saturated_client_rejects_immediately(self):
+        self.server.hold = asyncio.Event()
+        client = self.server.client(max_concurrency=1, max_queue=0)
+        first = asyncio.create_task(client.generate(COMMENT_PROMPT))
+        try:
+            await self.server.started.wait()
+            self.assertTrue(client.is_saturated())
+            with self.assertRaises(OllamaBusyError):
+                await client.generate(COMMENT_PROMPT)
+        finally:
+            self.server.hold.set()
+            await first
+            await client.aclose()
+        self.assertFalse(client.is_saturated())
+
+    async def test_generate_comment_answers_429_when_saturated(self):
+        self.server.hold = asyncio.Event()
+        client = self.server.client(max_concurrency=1, max_queue=0)
+        app = FastAPI()
+        app.include_router(ai_routes.router)
+        app.dependency_overrides[get_current_user] = lambda: {"user_id": "tester"}
+
+        first = asyncio.create_task(client.generate(COMMENT_PROMPT))
+        try:
+            await self.server.started.wait()
+            with mock.patch.object(ai_routes, "ollama_client", client):
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+                    response = await http.post("/generate-comment", json={"url": "c2F0dXJhZG8="})
+        finally:
+            self.server.hold.set()
+            await first
+            await client.aclose()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "5")
+        self.assertEqual(len(self.server.requests), 1)
+
+    async def test_aclose_closes_the_pool(self):
+        client = self.server.client()
+        await client.aclose()  # Sin conexiones abiertas no hace nada
+
+        await client.generate(COMMENT_PROMPT)
+        pool = client.client
+        await client.aclose()
+        self.assertTrue(pool.is_closed)
+
+        # Tras cerrar se abre un pool nuevo bajo demanda
+        self.assertEqual(await client.generate(COMMENT_PROMPT), "¡Qué foto tan bonita!")
+        second_pool = client.client
+        self.assertIsNot(second_pool, pool)
+        await client.aclose()
+        await client.aclose()  # Cerrar dos veces no falla
+        self.assertTrue(second_pool.is_closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -44,14 +44,19 @@ data class Post(
     @SerializedName("id") val id: String,
     @SerializedName("author_id") val authorId: String,
     @SerializedName("author_username") val authorUsername: String,
+    @SerializedName("author_profile_image_url") val authorProfileImageUrl: String? = null,
     @SerializedName("image_url") val imageUrl: String,
+    // thumb, feed y full; null en posts antiguos
+    @SerializedName("image_variants") val imageVariants: Map<String, String>? = null,
     @SerializedName("caption") val caption: String,
     @SerializedName("timestamp") val timestamp: String,
     @SerializedName("likes_count") var likesCount: Int,
     @SerializedName("comments_count") val commentsCount: Int,
     @SerializedName("is_liked") var isLiked: Boolean = false,
     @SerializedName("is_saved") var isSaved: Boolean = false
-) : Serializable
+) : Serializable {
+    fun imageUrlFor(variant: String): String = imageVariants?.get(variant) ?: imageUrl
+}
 
 @Composable
 fun PostItem(
@@ -155,7 +160,7 @@ fun PostItem(
             modifier = Modifier.padding(8.dp)
         ) {
             AsyncImage(
-                model = "${AppConfig.BASE_URL}/uploads/${post.authorId}.jpg",
+                model = "${AppConfig.BASE_URL}${post.authorProfileImageUrl ?: "/uploads/${post.authorId}.jpg"}",
                 contentDescription = "Profile picture of ${post.authorUsername}",
                 imageLoader = imageLoader,
                 modifier = Modifier
@@ -186,7 +191,7 @@ fun PostItem(
 
             AsyncImage(
                 model = ImageRequest.Builder(context)
-                    .data(if (!imageLoadError) "${AppConfig.BASE_URL}${post.imageUrl}" else null)
+                    .data(if (!imageLoadError) "${AppConfig.BASE_URL}${post.imageUrlFor("feed")}" else null)
                     .crossfade(true)
                     .build(),
                 contentDescription = "Post image by ${post.authorUsername}",
@@ -6,13 +6,15 @@ import java.io.Serializable
 data class User(
     @SerializedName("id") val id: String,
     @SerializedName("username") val username: String,
-    @SerializedName("email") val email: String,
+    // Solo viene en el perfil propio/completo; listados y seguidores no traen datos de contacto
+    @SerializedName("email") val email: String? = null,
     @SerializedName("profile_image_url") val profileImageUrl: String? = null,
     @SerializedName("phone") val phone: String? = null,
     @SerializedName("birth_date") val birthDate: String? = null,
-    @SerializedName("followers") val followers: List<String> = emptyList(),
-    @SerializedName("following") val following: List<String> = emptyList(),
-    @SerializedName("private_account") val private_account: Boolean = false
+    @SerializedName("followers_count") val followersCount: Int = 0,
+    @SerializedName("following_count") val followingCount: Int = 0,
+    @SerializedName("private_account") val private_account: Boolean = false,
+    @SerializedName("is_following") val isFollowing: Boolean? = null
 ) : Serializable
 
 fun createPabloUser() = User(
@@ -22,8 +24,8 @@ fun createPabloUser() = User(
     email = "pablo@example.com",
     phone = null,
     birthDate = null,
-    followers = emptyList(),
-    following = emptyList(),
+    followersCount = 0,
+    followingCount = 0,
     private_account = false
 )
 
@@ -43,8 +45,8 @@ data class UserResponse(
     @SerializedName("profile_image_url") val profileImageUrl: String? = null,
     @SerializedName("phone") val phone: String? = null,
     @SerializedName("birth_date") val birthDate: String? = null,
-    @SerializedName("followers") val followers: List<String> = emptyList(),
-    @SerializedName("following") val following: List<String> = emptyList(),
+    @SerializedName("followers_count") val followersCount: Int = 0,
+    @SerializedName("following_count") val followingCount: Int = 0,
     @SerializedName("private_account") val private_account: Boolean = false
 )
 
@@ -83,8 +83,8 @@ fun AppNavigation(
                     email = "",
                     phone = null,
                     profileImageUrl = null,
-                    followers = emptyList(),
-                    following = emptyList(),
+                    followersCount = 0,
+                    followingCount = 0,
                     private_account = false
                 ),
                 onLogout = onLogout,
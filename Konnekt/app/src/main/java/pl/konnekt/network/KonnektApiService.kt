@@ -3,14 +3,22 @@ package pl.konnekt.network
 import okhttp3.MultipartBody
 import okhttp3.RequestBody
 import pl.konnekt.models.*
+import retrofit2.Response
 import retrofit2.http.*
 
 interface KonnektApiService {
     @GET("users/{userId}")
-    suspend fun getUserProfile(@Path("userId") userId: String): User
+    suspend fun getUserProfile(
+        @Path("userId") userId: String,
+        @Query("current_user_id") currentUserId: String? = null
+    ): User
 
+    // Paginado: la siguiente página se pide con el cursor de la cabecera X-Next-Cursor
     @GET("users")
-    suspend fun getAllUsers(): List<User>
+    suspend fun getAllUsers(
+        @Query("after") after: String? = null,
+        @Query("limit") limit: Int? = null
+    ): Response<List<User>>
 
     @POST("login")
     suspend fun login(@Body loginRequest: Map<String, String>): LoginResponse
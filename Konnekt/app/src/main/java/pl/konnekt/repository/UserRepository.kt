@@ -5,12 +5,22 @@ import kotlinx.coroutines.flow.flow
 import pl.konnekt.models.User
 import pl.konnekt.network.KonnektApi
 import pl.konnekt.network.KonnektApiService
+import retrofit2.HttpException
 
 class UserRepository(
     private val api: KonnektApiService = KonnektApi.retrofitService
 ) {
     suspend fun getAllUsers(): List<User> {
-        return api.getAllUsers()
+        // GET /users devuelve páginas; se siguen los cursores hasta la última
+        val users = mutableListOf<User>()
+        var after: String? = null
+        do {
+            val response = api.getAllUsers(after)
+            if (!response.isSuccessful) throw HttpException(response)
+            users += response.body().orEmpty()
+            after = response.headers()["X-Next-Cursor"]
+        } while (after != null)
+        return users
     }
 
     suspend fun getUserProfile(userId: String): User {
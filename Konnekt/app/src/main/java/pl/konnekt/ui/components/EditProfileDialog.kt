@@ -47,7 +47,7 @@ fun EditProfileDialog(
     val calendar = remember { Calendar.getInstance() }
     val scope = rememberCoroutineScope()
     
-    var email by remember { mutableStateOf(user.email) }
+    var email by remember { mutableStateOf(user.email ?: "") }
     var phone by remember { mutableStateOf(user.phone ?: "") }
     var birthDate by remember { mutableStateOf(user.birthDate ?: "") }
     var selectedImageUri by remember { mutableStateOf<Uri?>(null) }
@@ -282,7 +282,7 @@ fun EditProfileDialog(
                         scope.launch {
                             isLoading = true
                             val updates = mutableMapOf<String, String>()
-                            if (email != user.email) updates["email"] = email
+                            if (email != (user.email ?: "")) updates["email"] = email
                             if (phone != user.phone) updates["phone"] = phone
                             if (birthDate != user.birthDate) updates["birth_date"] = birthDate
                             if (isPrivateAccount != user.private_account) {
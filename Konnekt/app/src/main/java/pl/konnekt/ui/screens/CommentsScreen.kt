@@ -102,7 +102,8 @@ fun CommentsScreen(postId: String) {
                     onClick = {
                         postViewModel.generateAIComment(
                             "${AppConfig.BASE_URL}$postImageUrl",
-                            context
+                            context,
+                            postId
                         ) { generatedComment ->
                             commentText = generatedComment
                         }
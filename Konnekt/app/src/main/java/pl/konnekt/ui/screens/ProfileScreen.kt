@@ -66,7 +66,7 @@ fun ProfileScreen(
     val displayUser = updatedUser ?: user
     val isLoading by viewModel.isLoading.collectAsState()
     val error by viewModel.error.collectAsState()
-    val isFollowing = displayUser.followers.contains(currentUserId)
+    val isFollowing = displayUser.isFollowing == true
     val canViewPosts = isCurrentUser || isFollowing || !displayUser.private_account
 
     // Load user profile and posts
@@ -207,8 +207,8 @@ fun ProfileScreen(
                             horizontalArrangement = Arrangement.SpaceEvenly
                         ) {
                             StatItem(label = "Posts", count = posts.size.toString())
-                            StatItem(label = "Seguidores", count = displayUser.followers.size.toString())
-                            StatItem(label = "Seguidos", count = displayUser.following.size.toString())
+                            StatItem(label = "Seguidores", count = displayUser.followersCount.toString())
+                            StatItem(label = "Seguidos", count = displayUser.followingCount.toString())
                             if (isCurrentUser) {
                                 Column(
                                     horizontalAlignment = Alignment.CenterHorizontally,
@@ -390,7 +390,7 @@ fun ProfileScreen(
                         verticalArrangement = Arrangement.spacedBy(4.dp)
                     ) {
                         items(posts) { post ->
-                            val postImageUrl = "${AppConfig.BASE_URL}${post.imageUrl}"
+                            val postImageUrl = "${AppConfig.BASE_URL}${post.imageUrlFor("thumb")}"
                             Log.d("ProfileScreen", "Loading post image: $postImageUrl")
                             Box(
                                 modifier = Modifier
@@ -73,7 +73,7 @@ fun SavedPostsScreen(
             verticalArrangement = Arrangement.spacedBy(4.dp)
         ) {
             items(posts) { post ->
-                val postImageUrl = "${AppConfig.BASE_URL}${post.imageUrl}"
+                val postImageUrl = "${AppConfig.BASE_URL}${post.imageUrlFor("thumb")}"
                 Log.d("SavedPostsScreen", "Loading post image: $postImageUrl")
                 
                 Box(
@@ -282,7 +282,7 @@ class PostViewModel : ViewModel() {
     val isGeneratingComment: StateFlow<Boolean> = _isGeneratingComment.asStateFlow()
     
     @OptIn(ExperimentalEncodingApi::class)
-    fun generateAIComment(url: String, context: Context, onSuccess: (String) -> Unit) {
+    fun generateAIComment(url: String, context: Context, postId: String? = null, onSuccess: (String) -> Unit) {
         viewModelScope.launch {
             try {
                 _isGeneratingComment.value = true
@@ -347,7 +347,11 @@ class PostViewModel : ViewModel() {
                 }
 
                 // Enviar solicitud a la API
-                val requestBody = mapOf("url" to base64Image)
+                // El post_id permite al backend usar la sugerencia precalculada
+                val requestBody = buildMap {
+                    put("url", base64Image)
+                    postId?.let { put("post_id", it) }
+                }
                 Log.d("PostViewModel", "Enviando solicitud a la API con base64")
 
                 val response = KonnektApi.retrofitService.generateComment(authHeader, requestBody)
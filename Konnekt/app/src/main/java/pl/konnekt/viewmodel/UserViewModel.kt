@@ -82,9 +82,9 @@ class UserViewModel : ViewModel() {
         viewModelScope.launch {
             try {
                 _isLoading.value = true
-                val user = KonnektApi.retrofitService.getUserProfile(userId)
+                val user = KonnektApi.retrofitService.getUserProfile(userId, currentUserId)
                 _userProfile.value = user
-                _canViewPosts.value = !user.private_account || user.followers.contains(currentUserId)
+                _canViewPosts.value = !user.private_account || user.isFollowing == true
                 checkFollowRequestStatus(userId, currentUserId)
                 Log.d("UserViewModel", "User profile loaded: $user")
             } catch (e: Exception) {
@@ -109,7 +109,7 @@ class UserViewModel : ViewModel() {
                 
                 val response = KonnektApi.retrofitService.updateProfile(userId, updates)
                 _userProfile.value = response
-                _canViewPosts.value = !response.private_account || response.followers.contains(userId)
+                _canViewPosts.value = !response.private_account || response.isFollowing == true
                 Log.d("UserViewModel", "Profile updated successfully: $response")
             } catch (e: retrofit2.HttpException) {
                 if (e.code() == 304) {